@@ -0,0 +1,262 @@
+"""
+Time each stage of the packaging and validation pipeline, cold and warm.
+
+A cold run starts with empty in-process caches; a warm run repeats the stage
+straight after, with everything it parsed still cached. Results are written as
+json, and can be compared against a stored baseline to flag regressions:
+
+    python .github/workflows/benchmark.py --output bench.json
+    python .github/workflows/benchmark.py --compare bench.json
+    python .github/workflows/benchmark.py --synthetic 10 --output bench-x10.json
+
+package_data and upsync_translations write outputs, caches and translation files
+into the corpus, so they run against a temporary copy of it.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(SCRIPT_DIR)
+
+import package_data
+import upsync_translations
+import utils
+import validate_refs
+from constants import DATA
+
+
+def reset_caches():
+    utils.TOML_CACHE.clear()
+    utils.PLAIN_TOML_CACHE.clear()
+    utils.reset_file_index()
+    utils.glob_to_regex.cache_clear()
+
+
+def fetch_all_data():
+    for config in DATA.values():
+        if config["type"] == "data":
+            utils.fetch_data(config["input"], config["output"])
+
+
+def fetch_all_locales():
+    for config in DATA.values():
+        if config["type"] == "locales":
+            utils.fetch_locales(config["input"], config["output"])
+
+
+def validate():
+    try:
+        validate_refs.main()
+    except SystemExit:
+        # errors in the corpus are not our concern here
+        pass
+
+
+def count_files(types: set[str], sources: bool = False) -> int:
+    files = set()
+    for config in DATA.values():
+        if config["type"] not in types:
+            continue
+        files.update(utils.find_files(config["input"]))
+        if sources and "source" in config:
+            files.update(utils.find_files(config["source"]))
+    return len(files)
+
+
+# stages which write into the corpus they run against
+WRITING_STAGES = {"package_data", "upsync_translations"}
+
+STAGES: dict[str, tuple[Callable[[], Any], Callable[[], int]]] = {
+    # stage: (run, count of files it reads)
+    "load_data": (utils.load_data, lambda: count_files({"data", "locales"})),
+    "fetch_data": (fetch_all_data, lambda: count_files({"data"})),
+    "fetch_locales": (fetch_all_locales, lambda: count_files({"locales"})),
+    "package_data": (package_data.main, lambda: count_files({"data", "locales"})),
+    "validate_refs": (validate, lambda: count_files({"data", "locales"}, True)),
+    "upsync_translations": (
+        upsync_translations.main,
+        lambda: count_files({"locales"}, True),
+    ),
+}
+
+
+def copy_corpus(out: Path):
+    """Copy every input and translation source in DATA to out."""
+    files = set()
+    for config in DATA.values():
+        files.update(utils.find_files(config["input"]))
+        if "source" in config:
+            files.update(utils.find_files(config["source"]))
+    for file in files:
+        (out / file).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(file, out / file)
+
+
+def run_quietly(run: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run()
+    return time.perf_counter() - start
+
+
+def measure_stage(run: Callable[[], Any], files: int, memory: bool) -> dict:
+    reset_caches()
+    cold = run_quietly(run)
+    warm = run_quietly(run)
+    results = {
+        "cold": {"wall_s": cold, "files": files, "files_per_s": files / cold},
+        "warm": {"wall_s": warm, "files": files, "files_per_s": files / warm},
+    }
+
+    if memory:
+        # a separate pass, since tracing allocations slows everything down
+        reset_caches()
+        tracemalloc.start()
+        for mode in ("cold", "warm"):
+            tracemalloc.reset_peak()
+            run_quietly(run)
+            results[mode]["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return results
+
+
+def run_benchmarks(stages: list[str], memory: bool = True) -> dict:
+    results = {}
+    for stage in stages:
+        run, count = STAGES[stage]
+        reset_caches()
+        results[stage] = measure_stage(run, count(), memory)
+        cold, warm = results[stage]["cold"], results[stage]["warm"]
+        print(
+            f"{stage}: cold {cold['wall_s']:.3f}s, warm {warm['wall_s']:.3f}s, "
+            f"{cold['files']} files"
+        )
+    return {
+        "meta": {
+            "corpus": os.getcwd(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Every stage and mode which got more than `threshold` slower or bigger."""
+    regressions = []
+    for stage, modes in current["results"].items():
+        for mode, metrics in modes.items():
+            old = baseline["results"].get(stage, {}).get(mode)
+            if not old:
+                continue
+            for metric in ("wall_s", "peak_bytes"):
+                if metric not in old or metric not in metrics:
+                    continue
+                if metrics[metric] > old[metric] * (1 + threshold):
+                    change = metrics[metric] / old[metric] - 1
+                    regressions.append(
+                        f"{stage} ({mode}): {metric} {old[metric]:.3f} -> "
+                        f"{metrics[metric]:.3f} (+{change:.0%})"
+                    )
+    return regressions
+
+
+def main(argv: argparse.Namespace):
+    # read the baseline before any chdir, so relative paths work as expected
+    baseline = json.loads(argv.compare.read_text()) if argv.compare else None
+    output = argv.output.resolve() if argv.output else None
+    if argv.corpus:
+        os.chdir(argv.corpus)
+
+    real_corpus = os.getcwd()
+    with tempfile.TemporaryDirectory() as corpus:
+        if argv.synthetic:
+            import synth_corpus
+
+            synth_corpus.main(Path(corpus), argv.synthetic, 1)
+            os.chdir(corpus)
+        elif WRITING_STAGES.intersection(argv.stages):
+            copy_corpus(Path(corpus))
+            os.chdir(corpus)
+        try:
+            results = run_benchmarks(argv.stages, memory=not argv.no_memory)
+        finally:
+            os.chdir(real_corpus)
+    if argv.synthetic:
+        results["meta"]["synthetic_scale"] = argv.synthetic
+    else:
+        results["meta"]["corpus"] = real_corpus
+    if output:
+        output.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+
+    if baseline:
+        regressions = compare(baseline, results, argv.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(f"{len(regressions)} regression(s) against {argv.compare}")
+        print(f"No regressions against {argv.compare}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--stages",
+        help="Stages to run, in order",
+        nargs="+",
+        choices=list(STAGES),
+        default=list(STAGES),
+    )
+    _ = parser.add_argument(
+        "--corpus",
+        help="Run against the corpus in this directory instead of the current one",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--synthetic",
+        help="Run against a temporary synthetic corpus this many times larger",
+        type=int,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--output",
+        help="Write results as json to this file",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--compare",
+        help="Flag regressions against results from an earlier --output",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--threshold",
+        help="How much slower (or bigger) counts as a regression, e.g. 0.2 for 20%%",
+        type=float,
+        default=0.2,
+    )
+    _ = parser.add_argument(
+        "--no-memory",
+        help="Skip the slower pass which measures peak memory",
+        action="store_true",
+    )
+    ARGV = parser.parse_args()
+    main(ARGV)
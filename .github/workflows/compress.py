@@ -0,0 +1,82 @@
+"""
+Pre-compressed .gz and .br siblings of packaged json, for static hosting.
+
+Both encodings use maximum compression and no timestamps, so the same json
+always compresses to the same bytes. Brotli needs the optional `brotli` package;
+without it only .gz siblings are written.
+"""
+
+import gzip
+import os
+from functools import partial
+from pathlib import Path
+
+ENCODINGS = ("gz", "br")
+
+
+def has_brotli() -> bool:
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def compress(raw: bytes, encoding: str) -> bytes:
+    if encoding == "gz":
+        return gzip.compress(raw, compresslevel=9, mtime=0)
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(raw, quality=11, lgwin=24)
+    raise ValueError(f"Unknown encoding {encoding}")
+
+
+def compress_file(path: Path, encodings: tuple[str, ...]) -> dict[str, int]:
+    """
+    Write each compressed sibling of `path` which is missing or older than it.
+    Returns the size of the file and of each sibling.
+    """
+    sizes = {"json": path.stat().st_size}
+    mtime = path.stat().st_mtime_ns
+    raw = None
+    for encoding in encodings:
+        sibling = path.with_name(f"{path.name}.{encoding}")
+        if not sibling.exists() or sibling.stat().st_mtime_ns < mtime:
+            if raw is None:
+                raw = path.read_bytes()
+            tmp_path = sibling.with_name(f".{sibling.name}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(compress(raw, encoding))
+            os.replace(tmp_path, sibling)
+        sizes[encoding] = sibling.stat().st_size
+    return sizes
+
+
+def compress_outputs(
+    root: str, encodings: tuple[str, ...] = ENCODINGS, workers: int = 1
+) -> dict[Path, dict[str, int]]:
+    if "br" in encodings and not has_brotli():
+        print("brotli is not installed; skipping .br files")
+        encodings = tuple(encoding for encoding in encodings if encoding != "br")
+
+    files = sorted(Path(root).rglob("*.json"))
+    compress_one = partial(compress_file, encodings=encodings)
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(compress_one, files, chunksize=8))
+    else:
+        sizes = list(map(compress_one, files))
+    return dict(zip(files, sizes))
+
+
+def print_sizes(root: str, sizes: dict[Path, dict[str, int]]):
+    totals: dict[str, int] = {}
+    for path, file_sizes in sizes.items():
+        columns = " ".join(f"{enc}={size}" for enc, size in file_sizes.items())
+        print(f"{path.relative_to(root)}: {columns}")
+        for encoding, size in file_sizes.items():
+            totals[encoding] = totals.get(encoding, 0) + size
+    columns = " ".join(f"{enc}={size}" for enc, size in totals.items())
+    print(f"Total for {len(sizes)} file(s): {columns}")
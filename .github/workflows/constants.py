@@ -24,6 +24,7 @@ class DataToPackage(TypedDict):
     translations: NotRequired[str]
     source: NotRequired[str]
     refs: NotRequired[list[Refs]]
+    search: NotRequired[list[str]]  # locale fields to build a search index over
 
 
 DATA: dict[str, DataToPackage] = {
@@ -156,6 +157,7 @@ DATA: dict[str, DataToPackage] = {
         "type": "locales",
         # "schema": "{id}.json",
         "source": "words/source/{id}.toml",
+        "search": ["definition", "commentary"],
     },
     "glyphs_locale": {
         "input": "glyphs/translations/{langcode}/{id}.toml",
@@ -163,6 +165,7 @@ DATA: dict[str, DataToPackage] = {
         "type": "locales",
         # "schema": "{id}.json",
         "source": "glyphs/source/{id}.toml",
+        "search": ["names", "commentary"],
     },
     "sandbox_words_locale": {
         "input": "sandbox/words/translations/{langcode}/{id}.toml",
@@ -170,6 +173,7 @@ DATA: dict[str, DataToPackage] = {
         "type": "locales",
         # "schema": "{id}.json",
         "source": "sandbox/words/source/{id}.toml",
+        "search": ["definition", "commentary"],
     },
     "sandbox_glyphs_locale": {
         "input": "sandbox/glyphs/translations/{langcode}/{id}.toml",
@@ -177,6 +181,7 @@ DATA: dict[str, DataToPackage] = {
         "type": "locales",
         # "schema": "{id}.json",
         "source": "sandbox/glyphs/source/{id}.toml",
+        "search": ["names", "commentary"],
     },
     "lp_signs_locale": {
         "input": "luka_pona/signs/translations/{langcode}/{id}.toml",
@@ -0,0 +1,196 @@
+"""
+A feed of RFC 6902 JSON Patch documents between successive packaged outputs, so
+clients can update their copy of the json instead of fetching it all again.
+
+Each packaging run which changes any output adds one delta, `<version>.json`:
+
+    {"from": 3, "to": 4,
+     "patches": {"words.json": [{"op": "replace", "path": "/a/book", ...}]},
+     "removed": []}
+
+Patch keys are output paths relative to the packaged root; a new file is one
+"add" of its whole document at path "". `manifest.json` holds the current
+version, a hash of the outputs at that version, and the chain of deltas:
+
+    {"version": 4, "hash": "...", "deltas": [{"from": 3, "to": 4, "size": 812}]}
+
+A client at version N applies every delta after N in order; one older than the
+oldest delta's "from" fetches everything again. If the outputs were changed
+without the feed (their hash is not the manifest's), the chain starts over.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any
+
+from utils import write_json
+
+MANIFEST = "manifest.json"
+# older deltas are deleted; a client further behind fetches everything again
+MAX_DELTAS = 50
+
+Patch = list[dict[str, Any]]
+
+
+def escape(token: str | int) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> Patch:
+    """The add, remove and replace operations which turn old into new."""
+    if type(old) is not type(new):
+        return [{"op": "replace", "path": path, "value": new}]
+    if isinstance(old, dict):
+        ops = []
+        for key in sorted(old.keys() - new.keys()):
+            ops.append({"op": "remove", "path": f"{path}/{escape(key)}"})
+        for key in sorted(new.keys()):
+            child = f"{path}/{escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": new[key]})
+            else:
+                ops.extend(make_patch(old[key], new[key], child))
+        return ops
+    if isinstance(old, list):
+        if old == new:
+            return []
+        # diff only what lies between the common prefix and suffix
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while (
+            end < min(len(old), len(new)) - start
+            and old[len(old) - 1 - end] == new[len(new) - 1 - end]
+        ):
+            end += 1
+        old_mid = old[start : len(old) - end]
+        new_mid = new[start : len(new) - end]
+        ops = []
+        for i in range(min(len(old_mid), len(new_mid))):
+            ops.extend(make_patch(old_mid[i], new_mid[i], f"{path}/{start + i}"))
+        # removed from the back, so earlier indexes stay valid
+        for i in reversed(range(len(new_mid), len(old_mid))):
+            ops.append({"op": "remove", "path": f"{path}/{start + i}"})
+        for i in range(len(old_mid), len(new_mid)):
+            ops.append(
+                {"op": "add", "path": f"{path}/{start + i}", "value": new_mid[i]}
+            )
+        return ops
+    if old != new:
+        return [{"op": "replace", "path": path, "value": new}]
+    return []
+
+
+def apply_patch(doc: Any, patch: Patch) -> Any:
+    """Apply the operations make_patch produces; doc is changed in place."""
+    for op in patch:
+        if op["path"] == "":
+            doc = op["value"]
+            continue
+        *parents, last = [unescape(token) for token in op["path"].split("/")[1:]]
+        target = doc
+        for token in parents:
+            target = target[int(token) if isinstance(target, list) else token]
+        if isinstance(target, list):
+            index = len(target) if last == "-" else int(last)
+            if op["op"] == "add":
+                target.insert(index, op["value"])
+            elif op["op"] == "remove":
+                del target[index]
+            else:
+                target[index] = op["value"]
+        elif op["op"] == "remove":
+            del target[last]
+        else:
+            target[last] = op["value"]
+    return doc
+
+
+def read_outputs(root: Path) -> dict[str, bytes]:
+    """Every json output under root, by its path relative to root."""
+    return {
+        path.relative_to(root).as_posix(): path.read_bytes()
+        for path in sorted(root.rglob("*.json"))
+    }
+
+
+def hash_outputs(outputs: dict[str, bytes]) -> str:
+    state = hashlib.sha256()
+    for name, raw in sorted(outputs.items()):
+        state.update(f"{name}\0{hashlib.sha256(raw).hexdigest()}\n".encode())
+    return state.hexdigest()
+
+
+def make_delta(old: dict[str, bytes], new: dict[str, bytes]) -> dict[str, Any]:
+    """Patches from the old outputs to the new, each checked by applying it."""
+    patches = {}
+    for name, raw in new.items():
+        if old.get(name) == raw:
+            continue
+        old_doc = json.loads(old[name]) if name in old else None
+        new_doc = json.loads(raw)
+        if old_doc is None:
+            patch = [{"op": "add", "path": "", "value": new_doc}]
+        else:
+            patch = make_patch(old_doc, new_doc)
+        if apply_patch(old_doc, patch) != new_doc:
+            raise ValueError(f"Patch of {name} does not reproduce it")
+        patches[name] = patch
+    return {"patches": patches, "removed": sorted(old.keys() - new.keys())}
+
+
+def load_manifest(delta_dir: Path) -> dict[str, Any] | None:
+    try:
+        return json.loads((delta_dir / MANIFEST).read_bytes())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def update_feed(delta_dir: Path, old: dict[str, bytes], new: dict[str, bytes]) -> int:
+    """
+    Add a delta from the old outputs to the new, if they differ, and prune old
+    deltas. Returns the version of the new outputs.
+    """
+    manifest = load_manifest(delta_dir)
+    new_hash = hash_outputs(new)
+    if manifest is None or manifest["hash"] != hash_outputs(old):
+        if manifest is not None:
+            print(f"Outputs changed outside of {delta_dir}; starting a new chain")
+        for stale in delta_dir.glob("*.json"):
+            stale.unlink()
+        version = manifest["version"] + 1 if manifest else 0
+        write_json(
+            delta_dir / MANIFEST, {"version": version, "hash": new_hash, "deltas": []}
+        )
+        return version
+
+    version = manifest["version"]
+    if new_hash == manifest["hash"]:
+        return version
+
+    delta = make_delta(old, new)
+    delta.update({"from": version, "to": version + 1})
+    write_json(delta_dir / f"{version + 1}.json", delta)
+    deltas = manifest["deltas"] + [
+        {
+            "from": version,
+            "to": version + 1,
+            "size": (delta_dir / f"{version + 1}.json").stat().st_size,
+        }
+    ]
+    for pruned in deltas[:-MAX_DELTAS]:
+        (delta_dir / f"{pruned['to']}.json").unlink(missing_ok=True)
+    manifest = {
+        "version": version + 1,
+        "hash": new_hash,
+        "deltas": deltas[-MAX_DELTAS:],
+    }
+    write_json(delta_dir / MANIFEST, manifest)
+    print(f"Wrote delta {version} -> {version + 1} for {len(delta['patches'])} file(s)")
+    return version + 1
@@ -1,27 +1,25 @@
+import argparse
 import json
 import os
 import sys
-import urllib.request
+from functools import cache
 from pathlib import Path
 
-from langcodes import Language, LanguageTagError
-
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(SCRIPT_DIR)
 
-from utils import deep_merge, load_languages, write_toml
-
-CROWDIN_TOKEN = os.environ["CROWDIN_TOKEN"]
-HEADERS = {"Authorization": f"Bearer {CROWDIN_TOKEN}"}
+import http_cache
+from utils import deep_merge, load_languages, print_changed_files, write_toml
 
 CROWDIN_PROJECT = "https://linku.crowdin.com/api/v2/projects/2"
 LANG_DIR = Path("languages/metadata")
+# endonyms from earlier runs, next to the cached responses
+ENDONYMS_FILE = "endonyms.json"
 
 
-def download(url: str) -> bytes:
-    req = urllib.request.Request(url, headers=HEADERS)
-    resp = urllib.request.urlopen(req).read()
-    return resp
+def get_headers() -> dict[str, str]:
+    # read on first request, so importing this module needs no token
+    return {"Authorization": f"Bearer {os.environ['CROWDIN_TOKEN']}"}
 
 
 def resolve_id(lang: dict, mappings: dict):
@@ -35,7 +33,10 @@ def resolve_id(lang: dict, mappings: dict):
     return twoletter
 
 
+@cache
 def fetch_endonym(lang_id: str) -> str | None:
+    from langcodes import Language, LanguageTagError
+
     try:
         lang = Language.get(lang_id)
         name = lang.display_name(lang_id)
@@ -43,22 +44,68 @@ def fetch_endonym(lang_id: str) -> str | None:
     except LanguageTagError:
         return None
 
-    if lang.startswith("Unknown"):
+    if name.startswith("Unknown"):
         return None
     if name == name_en:
         return None
     return name
 
 
-def main():
+def get_langcodes_version() -> str:
+    """Endonyms come from langcodes' data, so are only reused with the same data."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    versions = []
+    for package in ("langcodes", "language_data"):
+        try:
+            versions.append(f"{package}-{version(package)}")
+        except PackageNotFoundError:
+            versions.append(f"{package}-none")
+    return " ".join(versions)
+
+
+def get_endonyms(lang_ids: list[str], cache_dir: Path | None) -> dict[str, str | None]:
+    """
+    The endonym of each language. Only those not found by an earlier run with the
+    same langcodes are looked up, so an unchanged project never imports langcodes.
+    """
+    cache_file = cache_dir / ENDONYMS_FILE if cache_dir else None
+    data_version = get_langcodes_version()
+    endonyms = {}
+    if cache_file:
+        try:
+            cached = json.loads(cache_file.read_bytes())
+            if cached["version"] == data_version:
+                endonyms = cached["endonyms"]
+        except (OSError, json.JSONDecodeError, KeyError):
+            pass
+
+    missing = [lang_id for lang_id in lang_ids if lang_id not in endonyms]
+    for lang_id in missing:
+        endonyms[lang_id] = fetch_endonym(lang_id)
+    if cache_file and missing:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(
+            json.dumps({"version": data_version, "endonyms": endonyms}),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, cache_file)
+    return endonyms
+
+
+def main(client: http_cache.HttpClient, project_url: str = CROWDIN_PROJECT):
     known_langs = load_languages()
 
-    project_data = json.loads(download(CROWDIN_PROJECT))["data"]
+    with client:
+        project_data = json.loads(client.get(project_url))["data"]
     mappings = project_data["languageMapping"]
+    target_langs = project_data["targetLanguages"]
+    lang_ids = [resolve_id(lang, mappings) for lang in target_langs]
+    endonyms = get_endonyms(lang_ids, client.cache_dir)
 
-    for lang in project_data["targetLanguages"]:
-        lang_id = resolve_id(lang, mappings)
-        endonym = fetch_endonym(lang_id)
+    for lang_id, lang in zip(lang_ids, target_langs):
+        endonym = endonyms[lang_id]
         filtered_lang = {
             "id": lang_id,
             "locale": lang["locale"],
@@ -80,7 +127,19 @@ def main():
     for lang_id, data in known_langs.items():
         file = LANG_DIR / f"{lang_id}.toml"
         write_toml(file, data)
+    print_changed_files()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(
+        description="Add or update every language of the Crowdin project; "
+        "needs CROWDIN_TOKEN"
+    )
+    _ = parser.add_argument(
+        "--project-url",
+        help="Crowdin project to fetch, e.g. a local stand-in server for testing",
+        default=CROWDIN_PROJECT,
+    )
+    http_cache.add_arguments(parser)
+    ARGV = parser.parse_args()
+    main(http_cache.get_client(ARGV, get_headers()), ARGV.project_url)
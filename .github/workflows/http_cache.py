@@ -0,0 +1,226 @@
+"""
+HTTP GETs with a persistent cache of responses, for the Crowdin API.
+
+Each response body is kept in the cache dir with its ETag and Last-Modified. The
+next request for the same url sends them as If-None-Match and If-Modified-Since,
+and a 304 Not Modified reuses the cached body. One connection per host is kept
+open between requests. Connection errors, 429 and 5xx responses are retried with
+exponential backoff, or after the server's Retry-After.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin, urlsplit
+
+if TYPE_CHECKING:
+    import http.client
+    from email.message import Message
+
+import instrument
+
+DEFAULT_CACHE_DIR = Path(".cache/http")
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 5
+# the longest a Retry-After is honoured
+MAX_RETRY_AFTER_S = 60.0
+
+
+class HttpClient:
+    def __init__(
+        self,
+        cache_dir: Path | None = DEFAULT_CACHE_DIR,
+        headers: dict[str, str] | None = None,
+        retries: int = 4,
+        backoff: float = 1.0,
+        timeout: float = 30.0,
+    ):
+        self.cache_dir = cache_dir
+        self.headers = headers or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.connections: dict[tuple[str, str], "http.client.HTTPConnection"] = {}
+
+    def __enter__(self) -> "HttpClient":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections.clear()
+
+    def get_connection(self, scheme: str, netloc: str) -> "http.client.HTTPConnection":
+        import http.client
+
+        key = (scheme, netloc)
+        if key not in self.connections:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            elif scheme == "http":
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            else:
+                raise ValueError(f"Unsupported url scheme {scheme}")
+            self.connections[key] = connection
+        return self.connections[key]
+
+    def get_cache_paths(self, url: str) -> tuple[Path, Path]:
+        """The cached body of url, and its validators."""
+        assert self.cache_dir is not None
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{key}.body", self.cache_dir / f"{key}.json"
+
+    def load_cached(self, url: str) -> tuple[bytes, dict[str, str]] | None:
+        if self.cache_dir is None:
+            return None
+        body_path, meta_path = self.get_cache_paths(url)
+        try:
+            meta = json.loads(meta_path.read_bytes())
+            body = body_path.read_bytes()
+        except (OSError, json.JSONDecodeError):
+            return None
+        if meta.get("url") != url:
+            return None
+        return body, meta
+
+    def store(self, url: str, body: bytes, headers: "Message"):
+        if self.cache_dir is None:
+            return
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+        if not (meta["etag"] or meta["last_modified"]):
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        body_path, meta_path = self.get_cache_paths(url)
+        # body first, so validators are never stored for a body which is not
+        for path, raw in ((body_path, body), (meta_path, json.dumps(meta).encode())):
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(raw)
+            os.replace(tmp_path, path)
+
+    def request(
+        self, url: str, headers: dict[str, str]
+    ) -> tuple[int, "Message", bytes]:
+        """One GET on a kept-alive connection; reconnects once if it was closed."""
+        import http.client
+
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+        for attempt in range(2):
+            connection = self.get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (
+                http.client.RemoteDisconnected,
+                BrokenPipeError,
+                ConnectionResetError,
+            ):
+                # the server closed an idle connection; only retry on a fresh one
+                connection.close()
+                del self.connections[(parts.scheme, parts.netloc)]
+                if attempt:
+                    raise
+                continue
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                del self.connections[(parts.scheme, parts.netloc)]
+                raise
+            if response.will_close:
+                connection.close()
+                del self.connections[(parts.scheme, parts.netloc)]
+            return response.status, response.headers, body
+        raise AssertionError("unreachable")
+
+    def get_delay(self, attempt: int, headers: "Message | None") -> float:
+        retry_after = headers.get("Retry-After") if headers else None
+        if retry_after and retry_after.strip().isdigit():
+            return min(float(retry_after), MAX_RETRY_AFTER_S)
+        return self.backoff * 2**attempt
+
+    def get(self, url: str) -> bytes:
+        """The body of url, from the cache if the server says it is unchanged."""
+        import http.client
+        from urllib.error import HTTPError
+
+        cached = self.load_cached(url)
+        headers = dict(self.headers)
+        if cached:
+            _, meta = cached
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        location = url
+        redirects = 0
+        attempt = 0
+        while True:
+            try:
+                status, response_headers, body = self.request(location, headers)
+            except (OSError, http.client.HTTPException):
+                if attempt >= self.retries:
+                    raise
+                instrument.count("http_retries")
+                time.sleep(self.get_delay(attempt, None))
+                attempt += 1
+                continue
+
+            instrument.count("http_requests")
+            if status in RETRY_STATUSES and attempt < self.retries:
+                instrument.count("http_retries")
+                time.sleep(self.get_delay(attempt, response_headers))
+                attempt += 1
+                continue
+            if status in REDIRECT_STATUSES and redirects < MAX_REDIRECTS:
+                location = urljoin(location, response_headers["Location"])
+                redirects += 1
+                if urlsplit(location).netloc != urlsplit(url).netloc:
+                    headers.pop("Authorization", None)
+                continue
+            if status == 304 and cached:
+                instrument.count("http_cache_hits")
+                return cached[0]
+            if status != 200:
+                raise HTTPError(url, status, f"GET {url}", response_headers, None)
+            self.store(url, body, response_headers)
+            return body
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    _ = parser.add_argument(
+        "--http-cache-dir",
+        help="Keep responses between runs, and only fetch them again if changed",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+    )
+    _ = parser.add_argument(
+        "--no-http-cache",
+        help="Always fetch every response in full",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--retries",
+        help="Retries of a request failing with a connection error, 429 or 5xx",
+        type=int,
+        default=4,
+    )
+
+
+def get_client(args: argparse.Namespace, headers: dict[str, str]) -> HttpClient:
+    cache_dir = None if args.no_http_cache else args.http_cache_dir
+    return HttpClient(cache_dir=cache_dir, headers=headers, retries=args.retries)
@@ -0,0 +1,112 @@
+"""
+Stage timings and counters for the workflow scripts, reported as json:
+
+    python .github/workflows/package_data.py --report report.json --profile run.prof
+
+Stages are timed with `with stage("name"):` and may nest; repeated stages add up.
+Counters are bumped with `count("name", n)`. Work done in worker processes
+is not counted.
+"""
+
+import argparse
+import atexit
+import json
+import resource
+import sys
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Any, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+STAGES: dict[str, dict[str, float]] = {}
+COUNTERS: dict[str, int] = {}
+START = time.perf_counter()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = STAGES.setdefault(name, {"wall_s": 0.0, "calls": 0})
+        timing["wall_s"] += time.perf_counter() - start
+        timing["calls"] += 1
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator timing each call of a function as a stage."""
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def count(name: str, n: int = 1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+
+def get_peak_rss() -> int:
+    """Peak resident memory of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_report() -> dict[str, Any]:
+    return {
+        "script": Path(sys.argv[0]).name,
+        "argv": sys.argv[1:],
+        "wall_s": time.perf_counter() - START,
+        "peak_rss_bytes": get_peak_rss(),
+        "stages": STAGES,
+        "counters": dict(sorted(COUNTERS.items())),
+    }
+
+
+def write_report(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(get_report(), indent=2) + "\n", encoding="utf-8")
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    _ = parser.add_argument(
+        "--report",
+        help="Write stage timings, counters and peak memory as json to this file",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--profile",
+        help="Write cProfile stats of the whole run to this file",
+        type=Path,
+        default=None,
+    )
+
+
+def configure(args: argparse.Namespace):
+    # registered first so that it runs last, after the profile is written
+    if args.report:
+        atexit.register(write_report, args.report)
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump_profile():
+            profiler.disable()
+            args.profile.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(args.profile)
+
+        atexit.register(dump_profile)
@@ -0,0 +1,188 @@
+"""
+Canonical json for write_json: sorted keys, no whitespace, utf-8 instead of \\u escapes.
+
+The stdlib json module is the reference encoder. When the optional `orjson`
+package is installed it is used instead, as it writes the same bytes in about
+half the time, checks included. --json-check encodes every file with both, and fails on any
+difference, e.g. after upgrading orjson.
+"""
+
+import argparse
+import json
+import math
+import re
+from collections.abc import Iterator
+from typing import Any
+
+BACKEND_NAMES = ("auto", "stdlib", "orjson")
+
+BACKEND: str = "auto"
+CHECK: bool = False
+
+# a float in compact json follows one of ":[," and ends before one of ",]}"; the
+# same text inside a string may also match, which only costs a needless fallback
+FLOAT_RE = re.compile(
+    rb"[:\[,](-?\d+(?:\.\d+(?:[eE][-+]?\d+)?|[eE][-+]?\d+))(?=[,\]}])"
+)
+# encode() runs in C, but iterencode() (without the one-shot flag) does not
+STDLIB_ENCODER = json.JSONEncoder(
+    separators=(",", ":"),
+    ensure_ascii=False,
+    sort_keys=True,
+    allow_nan=False,
+)
+# top-level entries per chunk: enough to keep the cost per encode() call small,
+# few enough that memory is bounded by the largest entries, not the document
+STDLIB_CHUNK_ENTRIES = 64
+# orjson writes a float as repr does, except below 1e-4 (0.00001, 1.5e-7) and from
+# 1e16 (1e16): only output with "0.0000", or a digit then "e", can differ
+DIGITS_TO_ZERO = bytes.maketrans(b"123456789", b"000000000")
+
+
+def has_orjson() -> bool:
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def to_plain(value: Any) -> Any:
+    """
+    Convert one tomlkit item (with all it contains) or builtin subclass, such as a
+    defaultdict, to plain values; orjson calls this for anything else it meets.
+    """
+    if hasattr(value, "unwrap"):
+        return value.unwrap()
+    for plain in (dict, list, str, int, float):
+        if isinstance(value, plain):
+            return plain(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_stdlib(data: Any) -> bytes:
+    return STDLIB_ENCODER.encode(data).encode("utf-8")
+
+
+def encode_stdlib(data: Any) -> Iterator[bytes]:
+    """
+    Encode in chunks of a few top-level entries, so the whole document is never
+    held as one string. Each chunk is encoded in C by one STDLIB_ENCODER.encode().
+    """
+    if (
+        not data
+        or not isinstance(data, dict)
+        or not all(isinstance(key, str) for key in data)
+    ):
+        yield dumps_stdlib(data)
+        return
+    keys = sorted(data)
+    separator = "{"
+    for start in range(0, len(keys), STDLIB_CHUNK_ENTRIES):
+        chunk = {key: data[key] for key in keys[start : start + STDLIB_CHUNK_ENTRIES]}
+        # without its own braces, as it is part of the document's object
+        yield (separator + STDLIB_ENCODER.encode(chunk)[1:-1]).encode("utf-8")
+        separator = ","
+    yield b"}"
+
+
+def floats_match_stdlib(raw: bytes) -> bool:
+    """
+    Whether every float in orjson's output is written as stdlib json (i.e. repr)
+    writes it; they differ on exponents, e.g. 1e-05 is 0.00001 and 1e+16 is 1e16.
+    """
+    # two scans in C, so the regex only runs on the rare output which may differ
+    if b"0.0000" not in raw and b"0e" not in raw.translate(DIGITS_TO_ZERO):
+        return True
+    for match in FLOAT_RE.finditer(raw):
+        token = match.group(1)
+        if repr(float(token)).encode("ascii") != token:
+            return False
+    return True
+
+
+def has_nonfinite(value: Any) -> bool:
+    """Whether value holds a nan or infinity, which orjson writes as null."""
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(has_nonfinite(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_nonfinite(item) for item in value)
+    return False
+
+
+def encode_orjson(data: Any) -> Iterator[bytes]:
+    import orjson
+
+    try:
+        raw = orjson.dumps(
+            data,
+            default=to_plain,
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_SUBCLASS,
+        )
+    except orjson.JSONEncodeError:
+        # e.g. integers beyond 64 bits, which stdlib writes; or let stdlib raise
+        yield from encode_stdlib(data)
+        return
+    # toml has no null, so a null is a nan or infinity, which stdlib refuses; let
+    # it raise. Usually "null" is only text, e.g. German, so the data is checked
+    if (b"null" in raw and has_nonfinite(data)) or not floats_match_stdlib(raw):
+        yield from encode_stdlib(data)
+        return
+    yield raw
+
+
+BACKENDS = {
+    "stdlib": encode_stdlib,
+    "orjson": encode_orjson,
+}
+
+
+def get_backend() -> str:
+    if BACKEND == "auto":
+        return "orjson" if has_orjson() else "stdlib"
+    return BACKEND
+
+
+def encode(data: Any, name: str = "data") -> Iterator[bytes]:
+    """Encode data as canonical json with the chosen backend, in one or more chunks."""
+    backend = get_backend()
+    if not CHECK or backend == "stdlib":
+        return BACKENDS[backend](data)
+
+    raw = b"".join(BACKENDS[backend](data))
+    expected = b"".join(encode_stdlib(data))
+    if raw != expected:
+        offset = next(
+            (i for i, (a, b) in enumerate(zip(raw, expected)) if a != b),
+            min(len(raw), len(expected)),
+        )
+        context = slice(max(0, offset - 20), offset + 20)
+        raise ValueError(
+            f"{backend} json of {name} differs from stdlib json at byte {offset}: "
+            f"{raw[context]!r} != {expected[context]!r}"
+        )
+    return iter([raw])
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    _ = parser.add_argument(
+        "--json-backend",
+        help="Encoder for json outputs; auto uses orjson if it is installed",
+        choices=BACKEND_NAMES,
+        default="auto",
+    )
+    _ = parser.add_argument(
+        "--json-check",
+        help="Also encode every json output with stdlib json and fail on any difference",
+        action="store_true",
+    )
+
+
+def configure(args: argparse.Namespace):
+    global BACKEND, CHECK
+    if args.json_backend == "orjson" and not has_orjson():
+        raise SystemExit("--json-backend orjson needs the orjson package")
+    BACKEND = args.json_backend
+    CHECK = args.json_check
@@ -0,0 +1,133 @@
+"""
+How parsed toml is held in memory: an optional bound on the number of cached
+files, and an optional compact form of plain (tomllib) data.
+
+Compact data is plain dicts and lists, as from tomllib, with every key and every
+short string value interned, so the ids, langcodes, book names, urls and so on
+which repeat across files and languages are stored once. Round-trip (tomlkit)
+documents are never compacted, as write_toml needs their formatting.
+
+Compare the memory used by each form of the whole corpus with:
+
+    python .github/workflows/memory.py
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(SCRIPT_DIR)
+
+# longer strings are mostly prose, which rarely repeats
+INTERN_MAX_LEN = 256
+
+COMPACT: bool = False
+CACHES: list["LRUCache"] = []
+
+
+class LRUCache(OrderedDict):
+    """A dict which evicts its least recently used entries beyond `maxsize`."""
+
+    def __init__(self, maxsize: int | None = None):
+        super().__init__()
+        self.maxsize = maxsize
+        CACHES.append(self)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if self.maxsize is not None:
+            self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.maxsize is not None:
+            self.move_to_end(key)
+            while len(self) > self.maxsize:
+                self.popitem(last=False)
+
+
+def compact(value: Any) -> Any:
+    if isinstance(value, str):
+        return sys.intern(value) if len(value) <= INTERN_MAX_LEN else value
+    if isinstance(value, dict):
+        return {sys.intern(key): compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [compact(item) for item in value]
+    return value
+
+
+def enable(max_files: int | None = None, compacted: bool = True):
+    global COMPACT
+    COMPACT = compacted
+    for lru in CACHES:
+        lru.maxsize = max_files
+        while max_files is not None and len(lru) > max_files:
+            lru.popitem(last=False)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    _ = parser.add_argument(
+        "--max-cached-files",
+        help="Keep at most this many parsed toml files in memory (default: all)",
+        type=int,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--compact",
+        help="Intern repeated strings of parsed toml to use less memory",
+        action="store_true",
+    )
+
+
+def configure(args: argparse.Namespace):
+    if args.max_cached_files is not None or args.compact:
+        enable(args.max_cached_files, args.compact)
+
+
+def measure(parse) -> tuple[int, float]:
+    """Bytes held by, and seconds taken to build, the parse of every corpus file."""
+    import utils
+
+    files = sorted(
+        {file for t in utils.get_templates() for file in utils.find_files(t)}
+    )
+    tracemalloc.start()
+    start = time.perf_counter()
+    held = [parse(file) for file in files]
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size, elapsed
+
+
+def report():
+    import utils
+
+    forms = {
+        "tomlkit (round-trip)": lambda file: utils.parse_toml_file(file),
+        "tomllib (plain)": lambda file: utils.parse_toml_file(file, readonly=True),
+        "tomllib (compact)": lambda file: compact(
+            utils.parse_toml_file(file, readonly=True)
+        ),
+    }
+    baseline = None
+    for name, parse in forms.items():
+        size, elapsed = measure(parse)
+        baseline = baseline or size
+        print(
+            f"{name:>22}: {size / 1024 / 1024:7.1f} MiB "
+            f"({size / baseline:4.0%}), parsed in {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    ARGV = parser.parse_args()
+    report()
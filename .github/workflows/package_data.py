@@ -1,24 +1,292 @@
+import argparse
+import hashlib
+import json
 import os
 import sys
+from functools import partial
+from pathlib import Path
+from typing import Any
 
 # this lets you import from files in the same dir
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(SCRIPT_DIR)
 
-from constants import CURRENT_API_VERSION, DATA
-from utils import PACKAGE_MAP
+import instrument
+import json_backend
+import memory
+import parse_cache
+from constants import CURRENT_API_VERSION, DATA, DataToPackage
+from utils import (
+    PACKAGE_MAP,
+    SHARD_MAP,
+    find_files,
+    get_bound_param,
+    get_output_path,
+    get_path_values,
+    get_worker_count,
+    hash_file,
+    load_data,
+    print_changed_files,
+)
 
+ROOT = f"api/src/raw/{CURRENT_API_VERSION}/"
+MANIFEST_FILE = Path(".cache/package_manifest.json")
+MANIFEST_VERSION = 1
 
-def main():
-    for id, metadata in DATA.items():
-        input = metadata["input"]
-        output = metadata["output"]
-        typ = metadata["type"]
-        packager = PACKAGE_MAP[typ]
-        packager(f"api/src/raw/{CURRENT_API_VERSION}/", input, output)
+
+def config_hash(extras: dict[str, Any]) -> str:
+    """
+    Changing DATA can change every output, and enabling extra outputs (shards,
+    search indexes) needs them built for every input, so both invalidate the manifest.
+    """
+    raw = json.dumps([MANIFEST_VERSION, DATA, extras], sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def scan_inputs() -> dict[str, dict[str, str]]:
+    """Hash every input file of every DATA entry, keyed by entry then path."""
+    return {
+        key: {file.as_posix(): hash_file(file) for file in find_files(config["input"])}
+        for key, config in DATA.items()
+    }
+
+
+def load_manifest(
+    path: Path, extras: dict[str, Any]
+) -> dict[str, dict[str, str]] | None:
+    if not path.exists():
+        return None
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+    if manifest.get("config") != config_hash(extras):
+        return None
+    return manifest["files"]
+
+
+def save_manifest(path: Path, files: dict[str, dict[str, str]], extras: dict[str, Any]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    manifest = {"config": config_hash(extras), "files": files}
+    path.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+
+
+def get_stale_outputs(
+    root: str,
+    old: dict[str, dict[str, str]],
+    new: dict[str, dict[str, str]],
+) -> dict[str, set[str]]:
+    """
+    Map each DATA key to the outputs which must be rebuilt:
+    those fed by an added, removed or changed input, and those missing on disk.
+    """
+    stale: dict[str, set[str]] = {}
+    for key, config in DATA.items():
+        input = config["input"]
+        output = config["output"]
+        old_files = old.get(key, {})
+        new_files = new[key]
+
+        outputs = set()
+        for path in old_files.keys() | new_files.keys():
+            if old_files.get(path) != new_files.get(path):
+                outputs.add(get_output_path(input, output, path))
+        for path in new_files:
+            output_path = get_output_path(input, output, path)
+            if not (Path(root) / output_path).exists():
+                outputs.add(output_path)
+
+        if outputs:
+            stale[key] = outputs
+    return stale
+
+
+def get_stale_groups(key: str, files: dict[str, str], outputs: set[str]) -> set[str]:
+    """Find the groups (langcodes) of a locales entry whose outputs are stale."""
+    input = DATA[key]["input"]
+    output = DATA[key]["output"]
+    param = get_bound_param(input, output)
+    return {
+        get_path_values(input, path)[param]
+        for path in files
+        if get_output_path(input, output, path) in outputs
+    }
+
+
+def count_outputs(inputs: dict[str, dict[str, str]]) -> int:
+    outputs = set()
+    for key, files in inputs.items():
+        input = DATA[key]["input"]
+        output = DATA[key]["output"]
+        outputs.update(get_output_path(input, output, path) for path in files)
+    return len(outputs)
+
+
+def package_entry(
+    key: str,
+    metadata: DataToPackage,
+    options: dict[str, Any],
+    inputs: dict[str, dict[str, str]],
+    stale: dict[str, set[str]] | None,
+    shard_root: Path | None,
+    searchable: bool,
+):
+    """Run every packager of one DATA entry, limited to stale outputs if known."""
+    input = metadata["input"]
+    output = metadata["output"]
+    typ = metadata["type"]
+    packagers = [partial(PACKAGE_MAP[typ], ROOT)]
+    if shard_root:
+        packagers.append(partial(SHARD_MAP[typ], str(shard_root)))
+    if searchable and metadata.get("search"):
+        import search_index
+
+        packagers.append(partial(search_index.package_search_index, ROOT))
+
+    if stale is not None and key not in stale:
+        return
+    if stale is not None and typ == "locales":
+        groups = get_stale_groups(key, inputs[key], stale[key])
+        for packager in packagers:
+            packager(input, output, groups=groups, **options)
+        return
+    for packager in packagers:
+        packager(input, output, **options)
+
+
+def main(
+    incremental: bool = False,
+    manifest_file: Path = MANIFEST_FILE,
+    workers: int = 1,
+    readonly: bool = True,
+    compressed: bool = False,
+    shard_root: Path | None = None,
+    database: Path | None = None,
+    searchable: bool = False,
+    delta_dir: Path | None = None,
+):
+    if delta_dir:
+        import deltas
+
+        with instrument.stage("deltas"):
+            previous_outputs = deltas.read_outputs(Path(ROOT))
+
+    with instrument.stage("scan_inputs"):
+        inputs = scan_inputs()
+    extras = {
+        "shards": shard_root.as_posix() if shard_root else None,
+        "search_index": searchable,
+    }
+    previous = load_manifest(manifest_file, extras) if incremental else None
+    if incremental and previous is None:
+        print(f"No usable manifest at {manifest_file}; packaging everything")
+
+    options = {"workers": workers, "readonly": readonly}
+    stale = get_stale_outputs(ROOT, previous, inputs) if previous is not None else None
+
+    for key, metadata in DATA.items():
+        with instrument.stage(f"package {key}"):
+            package_entry(key, metadata, options, inputs, stale, shard_root, searchable)
+
+    if stale is not None:
+        rebuilt = sorted(path for outputs in stale.values() for path in outputs)
+        for path in rebuilt:
+            print(f"Rebuilt {path}")
+        print(f"Rebuilt {len(rebuilt)} output(s)")
+        instrument.count("outputs_skipped", count_outputs(inputs) - len(rebuilt))
+    save_manifest(manifest_file, inputs, extras)
+
+    if database:
+        # always built in full, from the (cached) parse of every input
+        import sqlite_build
+
+        with instrument.stage("sqlite"):
+            sqlite_build.build_database(database, load_data(**options))
+        print(f"Built {database}")
+
+    if compressed:
+        import compress
+
+        with instrument.stage("compress"):
+            sizes = compress.compress_outputs(ROOT, workers=workers)
+        compress.print_sizes(ROOT, sizes)
+
+    if delta_dir:
+        with instrument.stage("deltas"):
+            deltas.update_feed(
+                delta_dir, previous_outputs, deltas.read_outputs(Path(ROOT))
+            )
 
     print("Done!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--incremental",
+        help="Only rebuild outputs whose inputs changed since the last run",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--manifest",
+        help="Where to keep the input hashes between runs",
+        type=Path,
+        default=MANIFEST_FILE,
+    )
+    _ = parser.add_argument(
+        "--workers",
+        help="Number of processes parsing TOML files; 0 for one per cpu",
+        type=int,
+        default=1,
+    )
+    _ = parser.add_argument(
+        "--roundtrip",
+        help="Parse with tomlkit instead of tomllib; the output is the same",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--compress",
+        help="Also write .gz and .br (if brotli is installed) copies of each output",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--shards",
+        help="Also write one file per entry, e.g. words/{id}.json, under this dir",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--sqlite",
+        help="Also build a SQLite database of all data at this path (needs regex)",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--search-index",
+        help="Also write a search index next to each searchable translation output (needs regex)",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--deltas",
+        help="Also add a JSON Patch delta of the outputs to a feed in this dir",
+        type=Path,
+        default=None,
+    )
+    parse_cache.add_arguments(parser)
+    memory.add_arguments(parser)
+    json_backend.add_arguments(parser)
+    instrument.add_arguments(parser)
+    ARGV = parser.parse_args()
+    parse_cache.configure(ARGV)
+    memory.configure(ARGV)
+    json_backend.configure(ARGV)
+    instrument.configure(ARGV)
+    main(
+        incremental=ARGV.incremental,
+        manifest_file=ARGV.manifest,
+        workers=get_worker_count(ARGV.workers),
+        readonly=not ARGV.roundtrip,
+        compressed=ARGV.compress,
+        shard_root=ARGV.shards,
+        database=ARGV.sqlite,
+        searchable=ARGV.search_index,
+        delta_dir=ARGV.deltas,
+    )
+    print_changed_files()
@@ -0,0 +1,151 @@
+"""
+Opt-in persistent cache of parsed toml files, shared between script runs.
+
+Each entry is a pickle keyed on the file's path and parser, and is only used
+if the file's size and mtime are unchanged, or failing that if its content
+hash is unchanged (e.g. after a fresh checkout touches every mtime).
+"""
+
+import argparse
+import atexit
+import hashlib
+import os
+import pickle
+import shutil
+import sys
+from pathlib import Path
+from typing import Any
+
+import instrument
+
+# bump when the entry format changes
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = Path(".cache/toml")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+CACHE_DIR: Path | None = None
+MAX_BYTES: int = DEFAULT_MAX_BYTES
+
+
+def enable(cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+    global MAX_BYTES
+    MAX_BYTES = max_bytes
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    set_cache_dir(cache_dir)
+    prune()
+    atexit.register(prune)
+
+
+def set_cache_dir(cache_dir: Path | None):
+    """Also used to hand the cache to worker processes; None disables it."""
+    global CACHE_DIR
+    CACHE_DIR = cache_dir
+
+
+def clear(cache_dir: Path = DEFAULT_CACHE_DIR):
+    if cache_dir.exists():
+        shutil.rmtree(cache_dir)
+
+
+def prune():
+    """Evict least recently used entries until the cache fits in MAX_BYTES."""
+    if CACHE_DIR is None:
+        return
+    entries = []
+    for entry in CACHE_DIR.glob("*.pickle"):
+        stat = entry.stat()
+        entries.append((stat.st_mtime_ns, stat.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= MAX_BYTES:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+
+def get_entry_path(file: Path, readonly: bool) -> Path:
+    assert CACHE_DIR is not None
+    if readonly:
+        parser = "tomllib"
+    else:
+        import tomlkit
+
+        parser = f"tomlkit-{tomlkit.__version__}"
+    key = f"{CACHE_VERSION}:{sys.version_info[:2]}:{parser}:{file.as_posix()}"
+    return CACHE_DIR / f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.pickle"
+
+
+def load(file: Path, readonly: bool) -> Any | None:
+    if CACHE_DIR is None:
+        return None
+    entry_path = get_entry_path(file, readonly)
+    try:
+        entry = pickle.loads(entry_path.read_bytes())
+        stat = file.stat()
+    except (OSError, pickle.UnpicklingError, EOFError):
+        instrument.count("disk_cache_misses")
+        return None
+
+    if entry["size"] != stat.st_size:
+        instrument.count("disk_cache_misses")
+        return None
+    if entry["mtime_ns"] != stat.st_mtime_ns:
+        if entry["hash"] != hashlib.sha256(file.read_bytes()).hexdigest():
+            instrument.count("disk_cache_misses")
+            return None
+        # same content under a new mtime; remember it so we skip hashing next time
+        entry["mtime_ns"] = stat.st_mtime_ns
+        write_entry(entry_path, entry)
+    else:
+        # mark as recently used for prune()
+        os.utime(entry_path)
+    instrument.count("disk_cache_hits")
+    return entry["data"]
+
+
+def store(file: Path, readonly: bool, raw: bytes, data: Any):
+    """Cache `data`, which was parsed from `raw`, the current content of `file`."""
+    if CACHE_DIR is None or data is None:
+        return
+    stat = file.stat()
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": hashlib.sha256(raw).hexdigest(),
+        "data": data,
+    }
+    write_entry(get_entry_path(file, readonly), entry)
+
+
+def write_entry(entry_path: Path, entry: dict[str, Any]):
+    tmp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    os.replace(tmp_path, entry_path)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    _ = parser.add_argument(
+        "--cache-dir",
+        help=f"Keep parsed toml between runs, e.g. in {DEFAULT_CACHE_DIR}",
+        type=Path,
+        default=None,
+    )
+    _ = parser.add_argument(
+        "--cache-max-mb",
+        help="Evict least recently used cache entries beyond this size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // (1024 * 1024),
+    )
+    _ = parser.add_argument(
+        "--clear-cache",
+        help="Empty the cache directory before running",
+        action="store_true",
+    )
+
+
+def configure(args: argparse.Namespace):
+    cache_dir = args.cache_dir or DEFAULT_CACHE_DIR
+    if args.clear_cache:
+        clear(cache_dir)
+    if args.cache_dir:
+        enable(cache_dir, args.cache_max_mb * 1024 * 1024)
@@ -0,0 +1,123 @@
+"""
+Run translation sync, validation and packaging in one process, in that order:
+
+    python .github/workflows/pipeline.py --typecheck --cache-dir .cache/toml
+    python .github/workflows/pipeline.py --stages validate package validate_outputs
+
+Every stage reads through the same in-process toml caches, so each file is
+parsed once per run. Files written by sync are invalidated before later stages
+read them. A failing stage stops the run; otherwise it ends by listing every
+file whose content changed.
+"""
+
+import argparse
+import os
+import sys
+from collections.abc import Callable
+from pathlib import Path
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(SCRIPT_DIR)
+
+import instrument
+import json_backend
+import memory
+import package_data
+import parse_cache
+import upsync_translations
+import validate_refs
+from utils import CHANGED_FILES, get_worker_count, invalidate_file, print_changed_files
+
+
+def sync(args: argparse.Namespace):
+    written = upsync_translations.main(workers=args.workers, force=args.force)
+    if args.workers > 1:
+        # written by worker processes, so unknown to this one's caches
+        for tr_file in written:
+            invalidate_file(tr_file)
+        CHANGED_FILES.extend(written)
+
+
+def validate(args: argparse.Namespace):
+    validate_refs.main(workers=args.workers, typecheck=args.typecheck)
+
+
+def package(args: argparse.Namespace):
+    package_data.main(
+        incremental=args.incremental, workers=args.workers, delta_dir=args.deltas
+    )
+
+
+def validate_outputs(args: argparse.Namespace):
+    # needs jsonschema, so only imported if asked for
+    import validate_outputs
+
+    validate_outputs.main(workers=args.workers)
+
+
+STAGES: dict[str, Callable[[argparse.Namespace], None]] = {
+    "sync": sync,
+    "validate": validate,
+    "package": package,
+    "validate_outputs": validate_outputs,
+}
+DEFAULT_STAGES = ["sync", "validate", "package"]
+
+
+def main(args: argparse.Namespace):
+    for name in STAGES:
+        if name not in args.stages:
+            continue
+        print(f"== {name}")
+        with instrument.stage(f"pipeline {name}"):
+            STAGES[name](args)
+    print_changed_files()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--stages",
+        help="Stages to run; they always run in the order listed here",
+        nargs="+",
+        choices=list(STAGES),
+        default=DEFAULT_STAGES,
+    )
+    _ = parser.add_argument(
+        "--workers",
+        help="Number of processes for each stage; 0 for one per cpu",
+        type=int,
+        default=1,
+    )
+    _ = parser.add_argument(
+        "--force",
+        help="sync: rewrite every translation file, even if nothing changed",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--typecheck",
+        help="validate: also check each data file against its json schema",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--incremental",
+        help="package: only rebuild outputs whose inputs changed since the last run",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--deltas",
+        help="package: also add a JSON Patch delta of the outputs to a feed in this dir",
+        type=Path,
+        default=None,
+    )
+    parse_cache.add_arguments(parser)
+    memory.add_arguments(parser)
+    json_backend.add_arguments(parser)
+    instrument.add_arguments(parser)
+    ARGV = parser.parse_args()
+    ARGV.workers = get_worker_count(ARGV.workers)
+    parse_cache.configure(ARGV)
+    memory.configure(ARGV)
+    json_backend.configure(ARGV)
+    instrument.configure(ARGV)
+    main(ARGV)
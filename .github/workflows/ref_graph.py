@@ -0,0 +1,96 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from constants import DATA
+
+# (dataset key, object id), e.g. ("words", "akesi")
+Node = tuple[str, str]
+
+
+@dataclass
+class RefGraph:
+    """
+    Every reference between objects in DATA, built once per run from load_data().
+
+    - `ids`: dataset key -> ids of its objects
+    - `forward`: dataset key -> ref key -> object id -> referenced ids,
+      or None if the object lacks the ref key
+    - `reverse`: target dataset key -> target id -> ref key -> referring objects
+    """
+
+    ids: dict[str, set[str]]
+    forward: dict[str, dict[str, dict[str, list[str] | None]]]
+    reverse: dict[str, dict[str, dict[str, set[Node]]]]
+    valid_ids_cache: dict[tuple[str, ...], set[str]] = field(default_factory=dict)
+
+    def get_valid_ids(self, targets: list[str]) -> set[str]:
+        """Every id a ref to `targets` may use; shared between refs."""
+        key = tuple(sorted(targets))
+        if key not in self.valid_ids_cache:
+            valid_ids = set()
+            for target in key:
+                valid_ids.update(self.ids.get(target, set()))
+            self.valid_ids_cache[key] = valid_ids
+        return self.valid_ids_cache[key]
+
+    def resolve(self, targets: list[str], ref_id: str) -> Node | None:
+        """The object `ref_id` points to, checking `targets` in order."""
+        for target in targets:
+            if ref_id in self.ids.get(target, ()):
+                return target, ref_id
+        return None
+
+    def get_refs(self, key: str, ref_key: str) -> dict[str, list[str] | None]:
+        return self.forward.get(key, {}).get(ref_key, {})
+
+    def get_referrers(
+        self, key: str, obj_id: str, ref_key: str | None = None
+    ) -> set[Node]:
+        """Objects referring to `obj_id` of dataset `key`, optionally by one ref key."""
+        by_ref = self.reverse.get(key, {}).get(obj_id, {})
+        if ref_key is not None:
+            return set(by_ref.get(ref_key, ()))
+        return set().union(*by_ref.values())
+
+
+def build_ref_graph(data: dict[str, dict]) -> RefGraph:
+    ids = {key: set(objects.keys()) for key, objects in data.items()}
+    graph = RefGraph(ids=ids, forward={}, reverse={})
+
+    reverse = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
+    for key, config in DATA.items():
+        refs = config.get("refs", [])
+        if not refs:
+            continue
+        objects = data.get(key, {})
+        forward = {}
+        for ref in refs:
+            ref_key = ref["key"]
+            targets = ref["to"]
+            edges = {}
+            for obj_id, obj_data in objects.items():
+                raw_refs = obj_data.get(ref_key)
+                if isinstance(raw_refs, str):
+                    raw_refs = [raw_refs]
+                elif raw_refs is not None and not (
+                    isinstance(raw_refs, list)
+                    and all(isinstance(ref_id, str) for ref_id in raw_refs)
+                ):
+                    # if it isn't a str or list[str], that's a toml validation
+                    # error, which --typecheck reports; leave the object out
+                    continue
+                edges[obj_id] = None if raw_refs is None else list(raw_refs)
+
+                for ref_id in raw_refs or []:
+                    target = graph.resolve(targets, ref_id)
+                    if target:
+                        target_key, target_id = target
+                        reverse[target_key][target_id][ref_key].add((key, obj_id))
+            forward[ref_key] = edges
+        graph.forward[key] = forward
+
+    graph.reverse = {
+        target_key: {target_id: dict(by_ref) for target_id, by_ref in by_id.items()}
+        for target_key, by_id in reverse.items()
+    }
+    return graph
@@ -0,0 +1,126 @@
+"""
+Compiled JSON Schemas from api/generated/v2/, shared by the source and output checks.
+
+Each schema is read and compiled once per process. Needs the `jsonschema` package,
+and `rfc3986-validator` for its "uri" format; a schema using a format which
+cannot be checked is an error rather than silently unchecked.
+"""
+
+import json
+import re
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from jsonschema import Draft202012Validator, FormatChecker, ValidationError, validators
+
+from constants import CURRENT_API_VERSION, DataToPackage
+from utils import get_unbound_param, substitute_params
+
+SCHEMA_DIR = Path(f"api/generated/{CURRENT_API_VERSION}")
+
+JS_NAMED_GROUP_RE = re.compile(r"\(\?<(\w+)>")
+
+TRANSLATIONS = "translations"
+TRANSLATIONS_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "propertyNames": {"type": "string", "minLength": 1},
+    "additionalProperties": {
+        "type": "object",
+        "additionalProperties": {"$ref": "#/$defs/text"},
+    },
+    "$defs": {
+        "text": {
+            "anyOf": [
+                {"type": "string"},
+                {"type": "array", "items": {"type": "string"}},
+                {"type": "object", "additionalProperties": {"type": "string"}},
+            ]
+        }
+    },
+}
+
+
+@cache
+def compile_pattern(pattern: str) -> re.Pattern | None:
+    """
+    The schemas hold javascript regexes. The optional `regex` package understands
+    them; without it, named groups are translated for `re` and patterns using
+    unicode properties like \\p{Extended_Pictographic} are skipped.
+    """
+    try:
+        import regex
+
+        return regex.compile(pattern)
+    except ImportError:
+        pass
+    try:
+        return re.compile(JS_NAMED_GROUP_RE.sub(r"(?P<\1>", pattern))
+    except re.error:
+        return None
+
+
+def check_pattern(validator, pattern: str, instance: Any, schema: dict):
+    if not validator.is_type(instance, "string"):
+        return
+    compiled = compile_pattern(pattern)
+    if compiled is not None and not compiled.search(instance):
+        yield ValidationError(f"{instance!r} does not match {pattern!r}")
+
+
+Validator = validators.extend(Draft202012Validator, {"pattern": check_pattern})
+FORMAT_CHECKER = FormatChecker(Validator.FORMAT_CHECKER.checkers)
+
+
+@FORMAT_CHECKER.checks("emoji")
+def is_emoji(instance: Any) -> bool:
+    # zod writes the emoji regex as a "pattern" next to the format, which checks it
+    return True
+
+
+def get_formats(schema: Any) -> set[str]:
+    if isinstance(schema, list):
+        return {name for item in schema for name in get_formats(item)}
+    if not isinstance(schema, dict):
+        return set()
+    formats = {schema["format"]} if isinstance(schema.get("format"), str) else set()
+    for value in schema.values():
+        formats |= get_formats(value)
+    return formats
+
+
+@cache
+def get_validator(schema_name: str):
+    if schema_name == TRANSLATIONS:
+        schema = TRANSLATIONS_SCHEMA
+    else:
+        with open(SCHEMA_DIR / schema_name, "r", encoding="utf-8") as f:
+            schema = json.load(f)
+    unchecked = get_formats(schema) - FORMAT_CHECKER.checkers.keys()
+    if unchecked:
+        raise ValueError(
+            f"{schema_name} uses format(s) {', '.join(sorted(unchecked))} which "
+            "cannot be checked; is rfc3986-validator installed?"
+        )
+    return Validator(schema, format_checker=FORMAT_CHECKER)
+
+
+def format_errors(path: Path | str, validator, data: Any) -> list[str]:
+    return [
+        f"{path}: {error.json_path}: {error.message}"
+        for error in sorted(validator.iter_errors(data), key=lambda e: e.json_path)
+    ]
+
+
+def check_objects(config: DataToPackage, objects: dict[str, Any]) -> list[str]:
+    """Check each object of a "data" entry against the schema its toml file names."""
+    validator = get_validator(config["schema"])
+    key_param = get_unbound_param(config["input"], config["output"])
+    errors = []
+    for obj_id, obj_data in sorted(objects.items()):
+        path = substitute_params(config["input"], {key_param: obj_id})
+        # tomlkit documents (from readonly=False) validate as their plain values
+        plain = obj_data.unwrap() if hasattr(obj_data, "unwrap") else obj_data
+        errors.extend(format_errors(path, validator, plain))
+    return errors
@@ -0,0 +1,151 @@
+"""
+Per-language inverted indexes over the translated text of each locale entry,
+e.g. translations/de/words.index.json next to translations/de/words.json:
+
+    {"ids": ["a", "akesi", ...], "terms": {"reptil": [1, ...], ...}}
+
+Each posting list holds positions in "ids", sorted and delta-encoded, so
+[1, 3, 2] means ids[1], ids[4], ids[6]. Clients must tokenize queries with the
+same normalization as `tokenize`. Needs the `regex` package, for its unicode
+classes and grapheme clusters.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from constants import DATA
+from utils import fetch_locales, get_bound_param, substitute_params, write_json
+
+# words keep their combining marks, e.g. the vowel signs and viramas of devanagari
+WORD_PATTERN = r"[\w\p{M}]+"
+# scripts written without spaces between words: thai, hiragana, katakana, cjk
+# ideographs (and extension a), compatibility ideographs
+UNSPACED_PATTERN = (
+    r"([\u0e00-\u0e7f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)"
+)
+# accents on latin, greek and cyrillic; hebrew niqqud; arabic harakat
+DIACRITICS_RE = re.compile(r"[\u0300-\u036f\u0591-\u05c7\u064b-\u065f\u0670]")
+# arabic and persian letters which are written interchangeably
+ARABIC_FOLDING = str.maketrans(
+    {
+        "\u0623": "\u0627",  # alef with hamza above -> alef
+        "\u0625": "\u0627",  # alef with hamza below -> alef
+        "\u0622": "\u0627",  # alef with madda -> alef
+        "\u0671": "\u0627",  # alef wasla -> alef
+        "\u0649": "\u064a",  # alef maksura -> yeh
+        "\u06cc": "\u064a",  # farsi yeh -> yeh
+        "\u06a9": "\u0643",  # keheh -> kaf
+        "\u0629": "\u0647",  # teh marbuta -> heh
+        "\u0640": None,  # tatweel
+    }
+)
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    # drop direction marks and zero width (non-)joiners
+    text = "".join(char for char in text if unicodedata.category(char) != "Cf")
+    text = DIACRITICS_RE.sub("", unicodedata.normalize("NFD", text))
+    return unicodedata.normalize("NFC", text).translate(ARABIC_FOLDING)
+
+
+@cache
+def get_patterns():
+    import regex
+
+    return (
+        regex.compile(WORD_PATTERN),
+        regex.compile(UNSPACED_PATTERN),
+        regex.compile(r"\X"),
+    )
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split normalized text into words. Thai, Chinese and Japanese don't separate
+    words with spaces, so runs of their characters become single characters
+    (grapheme clusters, so a thai consonant keeps its vowel and tone marks) and
+    bigrams of them.
+    """
+    word_re, unspaced_re, grapheme_re = get_patterns()
+    tokens = []
+    for word in word_re.findall(normalize(text)):
+        for i, part in enumerate(unspaced_re.split(word)):
+            if not part:
+                continue
+            if i % 2 == 0:
+                tokens.append(part)
+                continue
+            chars = grapheme_re.findall(part)
+            tokens.extend(chars)
+            tokens.extend(chars[j] + chars[j + 1] for j in range(len(chars) - 1))
+    return tokens
+
+
+def get_texts(value: Any) -> list[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str)]
+    return []
+
+
+def build_index(objects: dict[str, dict[str, Any]], fields: list[str]) -> dict:
+    ids = sorted(objects)
+    postings: dict[str, set[int]] = defaultdict(set)
+    for position, obj_id in enumerate(ids):
+        for field in fields:
+            for text in get_texts(objects[obj_id].get(field)):
+                for token in tokenize(text):
+                    postings[token].add(position)
+
+    terms = {}
+    for term, positions in postings.items():
+        previous = 0
+        deltas = []
+        for position in sorted(positions):
+            deltas.append(position - previous)
+            previous = position
+        terms[term] = deltas
+    return {"ids": ids, "terms": terms}
+
+
+def search(index: dict, query: str) -> list[str]:
+    """The ids whose text contains every token of the query."""
+    found: set[int] | None = None
+    for token in tokenize(query):
+        positions = set()
+        position = 0
+        for delta in index["terms"].get(token, []):
+            position += delta
+            positions.add(position)
+        found = positions if found is None else found & positions
+    return [index["ids"][position] for position in sorted(found or ())]
+
+
+def get_index_path(output: str) -> str:
+    return output.removesuffix(".json") + ".index.json"
+
+
+def package_search_index(
+    root: str,
+    input: str,
+    output: str,
+    groups: set[str] | None = None,
+    workers: int = 1,
+    readonly: bool = True,
+):
+    """Index the `search` fields of a locales entry, one file per group."""
+    config = next(config for config in DATA.values() if config["input"] == input)
+    data = fetch_locales(
+        input, output, groups=groups, workers=workers, readonly=readonly
+    )
+    param = get_bound_param(input, output)
+    for group, objects in data.items():
+        output_path = substitute_params(output, {param: group})
+        index = build_index(objects, config["search"])
+        write_json(Path(root) / get_index_path(output_path), index)
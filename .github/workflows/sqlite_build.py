@@ -0,0 +1,162 @@
+"""
+Build one SQLite database of all packaged data, as an alternative to the json.
+
+- one table per "data" entry in DATA, named after its key, with a column per
+  top level field; lists and tables are stored as json text
+- `refs`: every reference listed in the DATA refs config, one row per target id
+- `translations`: every locale string, one row per dataset/langcode/object/field
+- `definitions_fts`: full text search over definitions in every language. The
+  `tokens` column holds the text split by search_index.tokenize, so Thai, Chinese
+  and Japanese are searchable too; query it with `MATCH match_query(text)`.
+  Needs the `regex` package.
+"""
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+from constants import DATA
+from search_index import tokenize
+from utils import hash_file, record_write
+
+INDEXED_COLUMNS = ["word_id", "usage_category", "book", "primary_glyph_id"]
+FTS_FIELDS = ["definition"]
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def to_sql_value(value: Any) -> Any:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (str, int, float)) or value is None:
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def match_query(text: str) -> str:
+    """An FTS5 query for definitions_fts which matches every token of text."""
+    return " ".join(f'"{token}"' for token in tokenize(text))
+
+
+def get_columns(objects: dict[str, dict]) -> list[str]:
+    columns = set()
+    for obj_data in objects.values():
+        columns.update(obj_data.keys())
+    columns.discard("id")
+    return ["id"] + sorted(columns)
+
+
+def create_data_table(db: sqlite3.Connection, table: str, objects: dict[str, dict]):
+    columns = get_columns(objects)
+    column_defs = ", ".join(
+        [f"{quote('id')} TEXT PRIMARY KEY"] + [quote(column) for column in columns[1:]]
+    )
+    db.execute(f"CREATE TABLE {quote(table)} ({column_defs})")
+
+    placeholders = ", ".join("?" for _ in columns)
+    rows = [
+        [obj_id] + [to_sql_value(obj_data.get(column)) for column in columns[1:]]
+        for obj_id, obj_data in sorted(objects.items())
+    ]
+    db.executemany(
+        f"INSERT INTO {quote(table)} VALUES ({placeholders})",
+        rows,
+    )
+
+    for column in INDEXED_COLUMNS:
+        if column in columns:
+            db.execute(
+                f"CREATE INDEX {quote(f'{table}_{column}')} "
+                f"ON {quote(table)} ({quote(column)})"
+            )
+
+
+def create_refs_table(db: sqlite3.Connection, data: dict[str, dict]):
+    db.execute(
+        "CREATE TABLE refs ("
+        "dataset TEXT, object_id TEXT, key TEXT, target_id TEXT, position INTEGER)"
+    )
+    rows = []
+    for key, config in DATA.items():
+        for ref in config.get("refs", []):
+            ref_key = ref["key"]
+            for obj_id, obj_data in sorted(data.get(key, {}).items()):
+                raw_refs = obj_data.get(ref_key)
+                if isinstance(raw_refs, str):
+                    raw_refs = [raw_refs]
+                for position, ref_id in enumerate(raw_refs or []):
+                    rows.append((key, obj_id, ref_key, ref_id, position))
+    db.executemany("INSERT INTO refs VALUES (?, ?, ?, ?, ?)", rows)
+    db.execute("CREATE INDEX refs_source ON refs (dataset, object_id)")
+    db.execute("CREATE INDEX refs_target ON refs (target_id, key)")
+
+
+def create_translations_tables(db: sqlite3.Connection, data: dict[str, dict]):
+    db.execute(
+        "CREATE TABLE translations ("
+        "dataset TEXT, langcode TEXT, object_id TEXT, field TEXT, value TEXT, "
+        "PRIMARY KEY (dataset, langcode, object_id, field))"
+    )
+    rows = []
+    for key, config in DATA.items():
+        tr_key = config.get("translations")
+        if not tr_key:
+            continue
+        for langcode, objects in sorted(data.get(tr_key, {}).items()):
+            for obj_id, fields in sorted(objects.items()):
+                for field, value in sorted(fields.items()):
+                    rows.append((key, langcode, obj_id, field, to_sql_value(value)))
+    db.executemany("INSERT INTO translations VALUES (?, ?, ?, ?, ?)", rows)
+    db.execute("CREATE INDEX translations_object ON translations (object_id)")
+
+    # tokens are already split and normalized, and joined by spaces; the ascii
+    # tokenizer splits them only there and at "_", alike in match_query
+    db.execute(
+        "CREATE VIRTUAL TABLE definitions_fts USING fts5("
+        "tokens, value UNINDEXED, dataset UNINDEXED, langcode UNINDEXED, "
+        "object_id UNINDEXED, tokenize = 'ascii')"
+    )
+    fields = ", ".join("?" for _ in FTS_FIELDS)
+    definitions = db.execute(
+        "SELECT value, dataset, langcode, object_id FROM translations "
+        f"WHERE field IN ({fields}) AND value != ''",
+        FTS_FIELDS,
+    ).fetchall()
+    db.executemany(
+        "INSERT INTO definitions_fts (tokens, value, dataset, langcode, object_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(" ".join(tokenize(row[0])), *row) for row in definitions],
+    )
+
+
+def build_database(path: Path, data: dict[str, dict]):
+    """
+    Build the database from load_data() into a temp file, then move it to path,
+    unless path already holds the same bytes.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    db = sqlite3.connect(tmp_path)
+    try:
+        with db:
+            for key, config in DATA.items():
+                if config["type"] == "data":
+                    create_data_table(db, key, data.get(key, {}))
+            create_refs_table(db, data)
+            create_translations_tables(db, data)
+        db.execute("VACUUM")
+    except BaseException:
+        db.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    db.close()
+    if record_write(path, tmp_path.stat().st_size, hash_file(tmp_path)):
+        os.replace(tmp_path, path)
+    else:
+        tmp_path.unlink()
@@ -0,0 +1,97 @@
+"""
+Time the import of each workflow module in a fresh interpreter, less the time the
+interpreter itself takes to start, and list the heavy dependencies it pulls in:
+
+    python .github/workflows/startup.py
+    python .github/workflows/startup.py --max-ms 50 utils package_data
+
+Importing a module should do no work, so this is what `--help` and any stage
+which is not run cost.
+"""
+
+import argparse
+import math
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# dependencies which only some stages need, so should only be imported by them
+HEAVY = [
+    "tomlkit",
+    "langcodes",
+    "jsonschema",
+    "sqlite3",
+    "urllib.request",
+    "concurrent.futures.process",
+    "cProfile",
+]
+
+
+def time_python(code: str, repeat: int) -> tuple[float, str]:
+    """Fastest wall time of `repeat` fresh interpreters running code, and its output."""
+    import time
+
+    best = math.inf
+    output = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        best = min(best, time.perf_counter() - start)
+        output = result.stdout
+    return best, output
+
+
+def measure(module: str, repeat: int) -> tuple[float, list[str]]:
+    code = (
+        f"import sys; sys.path.insert(0, {SCRIPT_DIR!r}); import {module}; "
+        f"print(*[name for name in {HEAVY!r} if name in sys.modules])"
+    )
+    elapsed, output = time_python(code, repeat)
+    return elapsed, output.split()
+
+
+def main(modules: list[str], repeat: int, max_ms: float | None):
+    baseline, _ = time_python("pass", repeat)
+    print(f"{'interpreter':>20}: {baseline * 1000:6.1f}ms")
+
+    slow = []
+    for module in modules:
+        elapsed, heavy = measure(module, repeat)
+        import_ms = max(0.0, elapsed - baseline) * 1000
+        print(f"{module:>20}: {import_ms:6.1f}ms  {' '.join(heavy)}")
+        if max_ms is not None and import_ms > max_ms:
+            slow.append(module)
+
+    if slow:
+        sys.exit(f"Slower than {max_ms}ms to import: {', '.join(slow)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "modules",
+        help="Modules to time (default: every module in this directory)",
+        nargs="*",
+    )
+    _ = parser.add_argument(
+        "--repeat",
+        help="Runs per module; the fastest is reported",
+        type=int,
+        default=5,
+    )
+    _ = parser.add_argument(
+        "--max-ms",
+        help="Fail if any module takes longer than this to import",
+        type=float,
+        default=None,
+    )
+    ARGV = parser.parse_args()
+    modules = ARGV.modules or sorted(
+        path.stem for path in Path(SCRIPT_DIR).glob("*.py") if path.stem != "startup"
+    )
+    main(modules, ARGV.repeat, ARGV.max_ms)
@@ -0,0 +1,171 @@
+"""
+Generate a synthetic corpus several times the size of the real one, for load testing:
+
+    python .github/workflows/synth_corpus.py --scale 10 --languages 2 /tmp/sona-x10
+    python .github/workflows/benchmark.py --corpus /tmp/sona-x10
+
+Every object of every "data" entry in DATA is copied `scale` times, with each
+copy's references pointing at the same copy of their targets, so the result
+passes validate_refs.py whenever the real corpus does. Translation sources and
+translations are copied to match, and every language `languages` times.
+"""
+
+import argparse
+import os
+import sys
+import tomllib
+from pathlib import Path
+from typing import Any
+
+import tomlkit
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(SCRIPT_DIR)
+
+from constants import DATA, LANG_DIR
+from utils import (
+    find_files_with_values,
+    get_bound_param,
+    get_unbound_param,
+    substitute_params,
+)
+
+# stands in for each object's key while rendering it
+KEY_PLACEHOLDER = "__synth_corpus_key__"
+
+
+def copy_id(obj_id: str, copy: int) -> str:
+    """The first copy keeps the real id, so real and synthetic data overlap."""
+    if copy == 0:
+        return obj_id
+    return f"{obj_id}-x{copy}"
+
+
+def copy_refs(value: Any, copy: int) -> Any:
+    if isinstance(value, str):
+        return copy_id(value, copy)
+    if isinstance(value, list):
+        return [copy_id(ref_id, copy) for ref_id in value]
+    return value
+
+
+def read_text(path: Path) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def generate_data(out: Path, key: str, scale: int, lang_copies: int):
+    config = DATA[key]
+    input = config["input"]
+    key_param = get_unbound_param(input, config["output"])
+    ref_keys = [ref["key"] for ref in config.get("refs", [])]
+    copies = lang_copies if input.startswith(LANG_DIR.as_posix()) else scale
+
+    for file, values in find_files_with_values(input):
+        doc = tomlkit.parse(read_text(file))
+        obj_id = values[key_param]
+        refs = {ref_key: doc[ref_key] for ref_key in ref_keys if ref_key in doc}
+        for copy in range(copies):
+            new_id = copy_id(obj_id, copy)
+            if "id" in doc:
+                doc["id"] = new_id
+            for ref_key, value in refs.items():
+                doc[ref_key] = copy_refs(value, copy)
+            path = substitute_params(input, {**values, key_param: new_id})
+            write_text(out / path, tomlkit.dumps(doc))
+
+
+def get_header(raw: str) -> str:
+    """The leading comments of a file, such as its #:schema line."""
+    lines = []
+    for line in raw.splitlines(keepends=True):
+        if not line.startswith("#"):
+            break
+        lines.append(line)
+    return "".join(lines)
+
+
+def copy_keys(raw: str, scale: int) -> str:
+    """
+    Repeat every top level object (keyed by id) of a locale file.
+    Each object is rendered once and only its key is swapped per copy,
+    as building large documents with tomlkit is very slow.
+    """
+    data = tomllib.loads(raw)
+    values = []
+    tables = []
+    for obj_id, value in data.items():
+        text = tomlkit.dumps({KEY_PLACEHOLDER: value})
+        (tables if isinstance(value, dict) else values).append((obj_id, text))
+
+    chunks = [get_header(raw)]
+    # plain values must come before any table; each sorted by id, as upsync
+    # writes them, so it has nothing to reorder
+    for entries in (values, tables):
+        copies = sorted(
+            (copy_id(obj_id, copy), text)
+            for copy in range(scale)
+            for obj_id, text in entries
+        )
+        for new_id, text in copies:
+            key = tomlkit.key(new_id).as_string()
+            chunks.append(text.replace(KEY_PLACEHOLDER, key))
+            if entries is tables:
+                chunks.append("\n")
+    return "".join(chunks)
+
+
+def write_text(path: Path, raw: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(raw, encoding="utf-8")
+
+
+def generate_locales(out: Path, key: str, scale: int, lang_copies: int):
+    config = DATA[key]
+    input = config["input"]
+    source = config["source"]
+    lang_param = get_bound_param(input, config["output"])
+
+    for file, values in find_files_with_values(source):
+        write_text(out / file, copy_keys(read_text(file), scale))
+
+    for file, values in find_files_with_values(input):
+        raw = copy_keys(read_text(file), scale)
+        for copy in range(lang_copies):
+            langcode = copy_id(values[lang_param], copy)
+            write_text(
+                out / substitute_params(input, {**values, lang_param: langcode}), raw
+            )
+
+
+def main(out: Path, scale: int, lang_copies: int):
+    for key, config in DATA.items():
+        print(f"Generating {key}")
+        if config["type"] == "data":
+            generate_data(out, key, scale, lang_copies)
+        else:
+            generate_locales(out, key, scale, lang_copies)
+    print("Done!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "out",
+        help="Directory to write the corpus to",
+        type=Path,
+    )
+    _ = parser.add_argument(
+        "--scale",
+        help="Copies of every word, glyph, sign, font and so on",
+        type=int,
+        default=10,
+    )
+    _ = parser.add_argument(
+        "--languages",
+        help="Copies of every language and its translations",
+        type=int,
+        default=1,
+    )
+    ARGV = parser.parse_args()
+    main(ARGV.out, ARGV.scale, ARGV.languages)
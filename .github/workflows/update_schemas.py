@@ -1,3 +1,4 @@
+import argparse
 import os
 import re
 import sys
@@ -7,7 +8,7 @@ SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(SCRIPT_DIR)
 
 from constants import DATA, DataToPackage
-from utils import find_files, get_path_values, get_unbound_param
+from utils import find_files_with_values, get_unbound_param
 
 SCHEMA_LINE_RE = re.compile(r"^#:schema .+$", re.MULTILINE)
 
@@ -21,10 +22,9 @@ def insert_or_update_schema_line(file_path: Path, schema_line: str):
     file_path.write_text("\n".join(content) + "\n", encoding="utf-8")
 
 
-def resolve_schema(schema_template: str, path: Path, input: str, output: str) -> str:
+def resolve_schema(schema_template: str, values: dict[str, str], output: str) -> str:
     if "{" in schema_template:
         param = get_unbound_param(schema_template, output)
-        values = get_path_values(input, str(path))
         return schema_template.format(**values)
     return schema_template
 
@@ -43,8 +43,8 @@ def update_schemas(entry: DataToPackage):
     if not schema_template:
         return
     prefix = get_depth_prefix(input)
-    for path in find_files(input):
-        resolved_schema = resolve_schema(schema_template, path, input, output)
+    for path, values in find_files_with_values(input):
+        resolved_schema = resolve_schema(schema_template, values, output)
         insert_or_update_schema_line(
             path, f"#:schema {prefix}/api/generated/v2/{resolved_schema}"
         )
@@ -56,4 +56,8 @@ def main():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Correct the #:schema line of every type checked toml file"
+    )
+    ARGV = parser.parse_args()
     main()
@@ -1,26 +1,32 @@
+import argparse
 import os
 import sys
+from collections.abc import Callable
+from functools import partial
 from pathlib import Path
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(SCRIPT_DIR)
 
+import instrument
+import memory
+import parse_cache
 from constants import DATA
 from utils import (
     cached_toml_read,
     deep_merge,
-    find_files,
-    get_path_values,
-    load_data,
+    find_files_with_values,
+    get_worker_count,
+    is_sorted,
     load_languages,
     remove_orphaned_keys,
     write_toml,
 )
 
 
-def main():
-    langs = load_languages()
-
+def get_sync_pairs(lang_id: str) -> list[tuple[Path, Path]]:
+    """Every (source file, translation file) pair of one language."""
+    pairs = []
     for key, config in DATA.items():
         if config["type"] != "locales":
             continue
@@ -29,21 +35,95 @@ def main():
 
         input = config["input"]
         source = config["source"]
-        for src_file in find_files(source):
-            values = get_path_values(source, str(src_file))
+        for src_file, values in find_files_with_values(source):
             src_key = next(iter(values.values()))
-            source_data = cached_toml_read(src_file)
+            # TODO: these should be possible to derive, rather than hardcode
+            tr_file = Path(input.format(**{"id": src_key, "langcode": lang_id}))
+            pairs.append((src_file, tr_file))
+    return pairs
+
+
+def sync_file(src_file: Path, tr_file: Path, force: bool = False) -> bool:
+    """Sync one translation file with its source, writing it only if it changed."""
+    source_data = cached_toml_read(src_file)
+    translation = cached_toml_read(tr_file)
+    if translation is None:
+        import tomlkit
+
+        translation = tomlkit.document()
+
+    changed = deep_merge(translation, source_data, overwrite_empty=True)
+    changed = bool(remove_orphaned_keys(translation, source_data)) or changed
+    if not (changed or force or not tr_file.exists() or not is_sorted(translation)):
+        return False
+
+    return write_toml(tr_file, translation)
+
+
+def sync_language(lang_id: str, force: bool = False) -> tuple[list[Path], int]:
+    """Returns the translation files which were written, and how many were not."""
+    written = []
+    skipped = 0
+    for src_file, tr_file in get_sync_pairs(lang_id):
+        if sync_file(src_file, tr_file, force):
+            written.append(tr_file)
+        else:
+            skipped += 1
+    return written, skipped
+
+
+def sync_languages(
+    sync: Callable[[str], tuple[list[Path], int]], lang_ids: list[str], workers: int
+) -> list[tuple[list[Path], int]]:
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=parse_cache.set_cache_dir,
+            initargs=(parse_cache.CACHE_DIR,),
+        ) as pool:
+            return list(pool.map(sync, lang_ids))
+    return list(map(sync, lang_ids))
+
+
+def main(workers: int = 1, force: bool = False) -> list[Path]:
+    """Returns every translation file which was written."""
+    langs = load_languages()
+    lang_ids = list(langs)
 
-            for lang_id, _ in langs.items():
-                # TODO: these should be possible to derive, rather than hardcode
-                tr_file = Path(input.format(**{"id": src_key, "langcode": lang_id}))
-                print(f"Syncing {src_file} to {tr_file}")
+    sync = partial(sync_language, force=force)
+    with instrument.stage("sync"):
+        results = sync_languages(sync, lang_ids, workers)
 
-                translation = cached_toml_read(tr_file)
-                deep_merge(translation, source_data, overwrite_empty=True)
-                remove_orphaned_keys(translation, source_data)
-                write_toml(tr_file, translation)
+    synced = []
+    for lang_id, (written, skipped) in zip(lang_ids, results):
+        for tr_file in written:
+            print(f"Synced {tr_file}")
+        synced.extend(written)
+        instrument.count("outputs_skipped", skipped)
+    print(f"Synced {len(synced)} translation file(s) in {len(lang_ids)} language(s)")
+    return synced
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--workers",
+        help="Number of languages to sync at once; 0 for one per cpu",
+        type=int,
+        default=1,
+    )
+    _ = parser.add_argument(
+        "--force",
+        help="Rewrite every translation file, even if nothing changed",
+        action="store_true",
+    )
+    parse_cache.add_arguments(parser)
+    memory.add_arguments(parser)
+    instrument.add_arguments(parser)
+    ARGV = parser.parse_args()
+    parse_cache.configure(ARGV)
+    memory.configure(ARGV)
+    instrument.configure(ARGV)
+    main(workers=get_worker_count(ARGV.workers), force=ARGV.force)
@@ -1,25 +1,42 @@
+import hashlib
 import json
 import os
 import re
 import sys
+import tomllib
 from collections import defaultdict
 from collections.abc import Iterator
+from functools import cache, partial
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import tomlkit
-import tomlkit.exceptions
-from tomlkit import TOMLDocument
+if TYPE_CHECKING:
+    from tomlkit import TOMLDocument
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(SCRIPT_DIR)
 
+import instrument
+import json_backend
+import memory
+import parse_cache
 from constants import DATA, LANG_DIR
 
-TOML_CACHE: dict[Path, TOMLDocument] = {}
+# round-trip documents, which keep comments and formatting for write_toml
+TOML_CACHE: dict[Path, "TOMLDocument"] = memory.LRUCache()
+# plain dicts from tomllib, for callers which never write back
+PLAIN_TOML_CACHE: dict[Path, dict[str, Any]] = memory.LRUCache()
+# list of ids written next to per-entry shards
+SHARD_INDEX = "_index.json"
+# files written with new content in this run, for print_changed_files()
+CHANGED_FILES: list[Path] = []
+# every corpus file matching a DATA template, keyed by template
+FILE_INDEX: dict[str, list[tuple[Path, dict[str, str]]]] | None = None
 
 
 def load_languages() -> dict[str, Any]:
+    import tomlkit
+
     known_langs = {}
     for file in LANG_DIR.glob("*.toml"):
         with file.open("r", encoding="utf-8") as f:
@@ -30,7 +47,25 @@ def load_languages() -> dict[str, Any]:
     return known_langs
 
 
-def load_data():
+def get_parse_errors() -> tuple[type[Exception], ...]:
+    """What either parser raises for invalid toml; only imports tomlkit if needed."""
+    from tomlkit.exceptions import TOMLKitError
+
+    return TOMLKitError, tomllib.TOMLDecodeError
+
+
+def load_data(
+    workers: int = 1, readonly: bool = True, type_errors: list[str] | None = None
+):
+    """
+    Fetch every entry in DATA. If `type_errors` is given, each "data" object is
+    also checked against its schema while parsed, and any errors are added to it,
+    as are toml syntax errors (which leave their entry out).
+    """
+    if type_errors is not None:
+        # needs jsonschema, which only type checking does
+        import schemas
+
     data = dict()
     for key, config in DATA.items():
         input = config["input"]
@@ -38,15 +73,24 @@ def load_data():
         typ = config["type"]
         fetcher = FETCH_MAP[typ]
         try:
-            data[key] = fetcher(input, output)
-        except tomlkit.exceptions.TOMLKitError as e:
-            print(f"TOMLKitError when packing {input} to {output} with {typ} formatter")
+            data[key] = fetcher(input, output, workers=workers, readonly=readonly)
+            if type_errors is not None and "schema" in config:
+                with instrument.stage("typecheck"):
+                    type_errors.extend(schemas.check_objects(config, data[key]))
+        except get_parse_errors() as e:
+            print(
+                f"{type(e).__name__} when packing {input} to {output} with {typ} formatter"
+            )
             # print(f"... Schema: {config.get('schema')} ")
             print(f"... {json.dumps(config, indent=2)}")
             print(f"... {e} {e.__dict__}")
+            if type_errors is not None:
+                file = " ".join(getattr(e, "__notes__", [])) or input
+                type_errors.append(f"{file}: {type(e).__name__}: {e}")
     return data
 
 
+@cache
 def glob_to_regex(glob_pattern: str) -> re.Pattern[str]:
     regex = re.escape(glob_pattern)
     regex = regex.replace(r"\{", "{").replace(r"\}", "}")
@@ -58,48 +102,314 @@ def substitute_params(template: str, params: dict[str, str]) -> str:
     return template.format(**params)
 
 
+def get_templates() -> list[str]:
+    """Every file path template in DATA: the inputs and translation sources."""
+    templates = []
+    for config in DATA.values():
+        templates.append(config["input"])
+        if "source" in config:
+            templates.append(config["source"])
+    return list(dict.fromkeys(templates))
+
+
+def build_file_index() -> dict[str, list[tuple[Path, dict[str, str]]]]:
+    """
+    Walk the corpus once, matching each file against every template once.
+    Files are listed in sorted order, along with their template's path values.
+    """
+    patterns = [(template, glob_to_regex(template)) for template in get_templates()]
+    roots = sorted({template.split("/", 1)[0] for template, _ in patterns})
+    index: dict[str, list[tuple[Path, dict[str, str]]]] = {
+        template: [] for template, _ in patterns
+    }
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = Path(dirpath, filename)
+                posix_path = path.as_posix()
+                for template, pattern in patterns:
+                    m = pattern.match(posix_path)
+                    if m:
+                        index[template].append((path, m.groupdict()))
+    return index
+
+
+def get_file_index() -> dict[str, list[tuple[Path, dict[str, str]]]]:
+    global FILE_INDEX
+    if FILE_INDEX is None:
+        FILE_INDEX = build_file_index()
+    return FILE_INDEX
+
+
+def reset_file_index():
+    """Forget the index, e.g. after files were added or removed."""
+    global FILE_INDEX
+    FILE_INDEX = None
+
+
+def index_file(path: Path):
+    """Add a newly written file to the index, if it is built and the file fits."""
+    if FILE_INDEX is None:
+        return
+    posix_path = path.as_posix()
+    for template, entries in FILE_INDEX.items():
+        m = glob_to_regex(template).match(posix_path)
+        if not m or any(file == path for file, _ in entries):
+            continue
+        entries.append((path, m.groupdict()))
+        entries.sort(key=lambda entry: entry[0])
+
+
+def unindex_file(path: Path):
+    """Remove a deleted file from the index, if it is built."""
+    if FILE_INDEX is None:
+        return
+    for entries in FILE_INDEX.values():
+        entries[:] = [entry for entry in entries if entry[0] != path]
+
+
+def invalidate_file(path: Path):
+    """Forget every cached parse of a file which changed on disk, and (re)index it."""
+    TOML_CACHE.pop(path, None)
+    PLAIN_TOML_CACHE.pop(path, None)
+    if path.exists():
+        index_file(path)
+    else:
+        unindex_file(path)
+
+
+def find_files_with_values(glob_pattern: str) -> Iterator[tuple[Path, dict[str, str]]]:
+    """Files matching a template, with the values of the template's params."""
+    index = get_file_index()
+    if glob_pattern in index:
+        return ((file, dict(values)) for file, values in index[glob_pattern])
+    return (
+        (file, get_path_values(glob_pattern, file.as_posix()))
+        for file in glob_files(glob_pattern)
+    )
+
+
 def find_files(glob_pattern: str) -> Iterator[Path]:
+    return (file for file, _ in find_files_with_values(glob_pattern))
+
+
+def glob_files(glob_pattern: str) -> Iterator[Path]:
     glob_path = re.sub(r"{\w+}", "*", glob_pattern)
     return Path().glob(glob_path)
 
 
-def cached_toml_read(file: Path, force: bool = False):
+def get_toml_cache(readonly: bool) -> dict[Path, Any]:
+    return PLAIN_TOML_CACHE if readonly else TOML_CACHE
+
+
+def cached_toml_read(file: Path, force: bool = False, readonly: bool = False):
+    """
+    Read a toml file once per process.
+    `readonly` callers get plain dicts from the much faster tomllib;
+    anyone who may `write_toml` the result needs the default tomlkit document.
+    """
     # don't cached read if the file doesn't exist
     if not file.exists():
         return None
 
-    if file in TOML_CACHE and not force:
-        return TOML_CACHE[file]
-    with open(file, "r", encoding="utf-8") as f:
-        data = tomlkit.parse(f.read())
-    TOML_CACHE[file] = data
+    cache = get_toml_cache(readonly)
+    if file in cache and not force:
+        instrument.count("toml_cache_hits")
+        return cache[file]
+    if readonly and file in TOML_CACHE and not force:
+        # unwrapping a tomlkit document is far cheaper than parsing again
+        instrument.count("toml_cache_hits")
+        return cache_parsed(file, TOML_CACHE[file].unwrap(), readonly)
+    instrument.count("toml_cache_misses")
+    data = None if force else parse_cache.load(file, readonly)
+    if data is None:
+        data = parse_toml_file(file, readonly)
+    return cache_parsed(file, data, readonly)
+
+
+def cache_parsed(file: Path, data: Any, readonly: bool) -> Any:
+    """Keep a parse in memory, compacted if enabled and it is plain data."""
+    if readonly and memory.COMPACT and data is not None:
+        data = memory.compact(data)
+    get_toml_cache(readonly)[file] = data
     return data
 
 
-def write_json(path: Path, data):
-    path.parent.mkdir(parents=True, exist_ok=True)
-    raw_data = json.dumps(
-        data,
-        separators=(",", ":"),
-        ensure_ascii=False,
-        sort_keys=True,
-        allow_nan=False,
-    )
-    return path.write_text(raw_data)
+def hash_file(file: Path) -> str:
+    """sha256 of a file, read in blocks rather than all at once."""
+    with open(file, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def parse_toml_file(file: Path, readonly: bool = False) -> Any:
+    """Parse a file, updating the persistent parse cache if one is enabled."""
+    if not file.exists():
+        return None
+    with instrument.stage("parse_toml"):
+        raw = file.read_bytes()
+        # same newline handling as reading in text mode
+        text = raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        try:
+            if readonly:
+                data = tomllib.loads(text)
+            else:
+                import tomlkit
+
+                data = tomlkit.parse(text)
+        except get_parse_errors() as e:
+            # the errors only give a line and column; name the file (see load_data)
+            e.add_note(file.as_posix())
+            raise
+    instrument.count("files_parsed")
+    instrument.count("bytes_read", len(raw))
+    parse_cache.store(file, readonly, raw, data)
+    return data
+
+
+def cached_toml_read_many(
+    files: list[Path], workers: int = 1, readonly: bool = False
+) -> list:
+    """
+    Read many files through the cache, in the order given.
+    With more than one worker, uncached files are parsed in a process pool. Their
+    parses are returned directly, as a bounded cache may already have evicted them.
+    """
+    if workers <= 1:
+        return [cached_toml_read(file, readonly=readonly) for file in files]
+
+    cache = get_toml_cache(readonly)
+    results = {}
+    uncached = []
+    for file in dict.fromkeys(files):
+        if file in cache or (readonly and file in TOML_CACHE):
+            results[file] = cached_toml_read(file, readonly=readonly)
+            continue
+        data = parse_cache.load(file, readonly)
+        if data is None:
+            uncached.append(file)
+        else:
+            results[file] = cache_parsed(file, data, readonly)
+    if len(uncached) > 1:
+        chunksize = max(1, len(uncached) // (workers * 4))
+        parse = partial(parse_toml_file, readonly=readonly)
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=parse_cache.set_cache_dir,
+            initargs=(parse_cache.CACHE_DIR,),
+        ) as pool:
+            parsed = pool.map(parse, uncached, chunksize=chunksize)
+            instrument.count("files_parsed_by_workers", len(uncached))
+            for file, data in zip(uncached, parsed):
+                if data is not None:
+                    results[file] = cache_parsed(file, data, readonly)
+    return [
+        results[file] if file in results else cached_toml_read(file, readonly=readonly)
+        for file in files
+    ]
+
+
+def get_worker_count(workers: int) -> int:
+    """0 means one worker per cpu."""
+    if workers > 0:
+        return workers
+    return os.cpu_count() or 1
+
+
+def is_unchanged(path: Path, size: int, digest: str) -> bool:
+    """Whether path holds `size` bytes with sha256 `digest`; size is checked first."""
+    try:
+        if path.stat().st_size != size:
+            return False
+        return hash_file(path) == digest
+    except FileNotFoundError:
+        return False
+
+
+def record_write(path: Path, size: int, digest: str) -> bool:
+    """
+    Count a write of `size` bytes with sha256 `digest` to path, or a skipped one if
+    the file already holds them, which leaves its mtime alone. Returns whether it
+    needs writing.
+    """
+    if is_unchanged(path, size, digest):
+        instrument.count("files_unchanged")
+        return False
+    instrument.count("files_written")
+    instrument.count("bytes_written", size)
+    CHANGED_FILES.append(path)
+    return True
+
 
+def print_changed_files():
+    """Print every file written with new content in this run, once each."""
+    changed = list(dict.fromkeys(CHANGED_FILES))
+    for path in changed:
+        print(f"Changed {path.as_posix()}")
+    print(f"{len(changed)} file(s) changed")
 
-def write_toml(path: Path, data):
+
+def write_json(path: Path, data) -> bool:
+    """
+    Write canonical json (see json_backend) to a temp file, then move it into place,
+    so a crash mid-write leaves the old file intact. The json is streamed to the
+    temp file and hashed on the way; if the file already holds the same bytes the
+    temp file is dropped and the file is not touched. Returns whether it changed.
+    Only stdlib json streams; orjson encodes the whole document as one bytes object.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in json_backend.encode(data, path.as_posix()):
+                size += f.write(chunk)
+                digest.update(chunk)
+        changed = record_write(path, size, digest.hexdigest())
+        if changed:
+            os.replace(tmp_path, path)
+        else:
+            tmp_path.unlink()
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return changed
+
+
+def is_sorted(data: dict) -> bool:
+    keys = list(data.keys())
+    return keys == sorted(keys)
+
+
+def write_toml(path: Path, data) -> bool:
+    """Write data sorted by key, unless the file already holds it; see write_json."""
     path.parent.mkdir(parents=True, exist_ok=True)
 
-    sorted_items = [(key, data[key]) for key in sorted(data.keys())]
-    data.clear()
-    for key, value in sorted_items:
-        data.add(key, value)
+    if not is_sorted(data):
+        sorted_items = [(key, data[key]) for key in sorted(data.keys())]
+        data.clear()
+        for key, value in sorted_items:
+            data.add(key, value)
+
+    import tomlkit
 
     raw = tomlkit.dumps(data)
     if raw.startswith("\n"):
         raw = raw.lstrip("\n")
-    return path.write_text(raw, encoding="utf-8")
+    encoded = raw.encode("utf-8")
+    changed = record_write(path, len(encoded), hashlib.sha256(encoded).hexdigest())
+    if changed:
+        _ = path.write_bytes(encoded)
+    # the written document may stay cached, but any other parse is out of date
+    if TOML_CACHE.get(path) is data:
+        PLAIN_TOML_CACHE.pop(path, None)
+        index_file(path)
+    else:
+        invalidate_file(path)
+    return changed
 
 
 def get_unbound_param(input: str, output: str) -> str:
@@ -141,18 +451,31 @@ def get_path_values(input: str, path: str):
     return m.groupdict()
 
 
-def deep_merge(parent: dict, child: dict, overwrite_empty: bool = False):
+def get_output_path(input: str, output: str, path: str) -> str:
+    """Resolve which output file the input file at `path` is packaged into."""
+    values = get_path_values(input, path)
+    output_vars: list[str] = re.findall(r"{(\w+)}", output)
+    return substitute_params(output, {var: values[var] for var in output_vars})
+
+
+def deep_merge(parent: dict, child: dict, overwrite_empty: bool = False) -> bool:
     """Merge the keys of a child dictionary into a parent dictionary.
-    Does not overwrite existing keys on the parent."""
+    Does not overwrite existing keys on the parent.
+    Returns whether the parent changed."""
+    changed = False
     for key in child:
         if key not in parent:
             parent[key] = child[key]
+            changed = True
             continue
         if overwrite_empty and not parent[key]:
-            parent[key] = child[key]
+            if parent[key] != child[key]:
+                parent[key] = child[key]
+                changed = True
             continue
         if isinstance(parent[key], dict) and isinstance(child[key], dict):
-            deep_merge(parent[key], child[key])
+            changed = deep_merge(parent[key], child[key]) or changed
+    return changed
 
 
 def has_same_keys(d1: dict, d2: dict):
@@ -163,12 +486,14 @@ def has_same_keys(d1: dict, d2: dict):
 
 
 def remove_orphaned_keys(translation: dict, source: dict, path=""):
-    warnings = []
+    """Delete keys missing from the source. Returns the removed key paths."""
+    removed = []
     keys_to_remove = [key for key in translation if key not in source]
 
     for key in keys_to_remove:
         print(f"Key '{path + key}' in translation but not source; removing.")
         del translation[key]
+        removed.append(path + key)
 
     for key in list(translation.keys()):
         if (
@@ -176,24 +501,32 @@ def remove_orphaned_keys(translation: dict, source: dict, path=""):
             and isinstance(translation[key], dict)
             and isinstance(source[key], dict)
         ):
-            sub_warnings = remove_orphaned_keys(
+            sub_removed = remove_orphaned_keys(
                 translation[key], source[key], path + key + "."
             )
-            warnings.extend(sub_warnings)
+            removed.extend(sub_removed)
 
-    return warnings
+    return removed
 
 
-def fetch_data(input: str, output: str, log: bool = False) -> dict[str, dict]:
+@instrument.timed("fetch_data")
+def fetch_data(
+    input: str,
+    output: str,
+    log: bool = False,
+    workers: int = 1,
+    readonly: bool = True,
+) -> dict[str, dict]:
     key_param = get_unbound_param(input, output)
     data = defaultdict(lambda: defaultdict(defaultdict))
-    for file in find_files(input):
+    indexed = list(find_files_with_values(input))
+    files = [file for file, _ in indexed]
+    local_datas = cached_toml_read_many(files, workers, readonly)
+    for (file, values), local_data in zip(indexed, local_datas):
         if log:
             print(file)
 
-        values = get_path_values(input, str(file))
         label = values.pop(key_param)
-        local_data = cached_toml_read(file)
         if not local_data:
             print(f"Data file {file} was missing!")
             continue
@@ -202,26 +535,46 @@ def fetch_data(input: str, output: str, log: bool = False) -> dict[str, dict]:
     return dict(data)
 
 
-def package_data(root: str, input: str, output: str):
-    data = fetch_data(input, output, log=True)
+def package_data(
+    root: str, input: str, output: str, workers: int = 1, readonly: bool = True
+):
+    data = fetch_data(input, output, log=True, workers=workers, readonly=readonly)
     output_path = Path(root) / Path(output)
     # no top level key, so just write the data
     write_json(output_path, data)
 
 
-def fetch_locales(input: str, output: str, log: bool = False) -> dict[str, dict]:
+@instrument.timed("fetch_locales")
+def fetch_locales(
+    input: str,
+    output: str,
+    log: bool = False,
+    groups: set[str] | None = None,
+    workers: int = 1,
+    readonly: bool = True,
+) -> dict[str, dict]:
+    """
+    Collect locale files into one object per group (usually langcode).
+    If `groups` is given, files belonging to any other group are not read.
+    """
     key_param = get_unbound_param(input, output)  # should be id
     data = defaultdict(lambda: defaultdict(defaultdict))
-    for file in find_files(input):
-        if log:
-            print(file)
-
-        values = get_path_values(input, str(file))
+    files = []
+    for file, values in find_files_with_values(input):
         label = values.pop(key_param)
         group = next(iter(values.values()))  # type of locale str
+        if groups is not None and group not in groups:
+            continue
+        files.append((file, label, group))
+
+    paths = [file for file, _, _ in files]
+    for (file, label, group), local_data in zip(
+        files, cached_toml_read_many(paths, workers, readonly)
+    ):
+        if log:
+            print(file)
 
         # each translation file
-        local_data = cached_toml_read(file)
         if not local_data:
             print(f"Locale file {file} was missing!")
             continue
@@ -232,13 +585,66 @@ def fetch_locales(input: str, output: str, log: bool = False) -> dict[str, dict]
     return dict(data)
 
 
-def package_locales(root: str, input: str, output: str):
-    data = fetch_locales(input, output, log=True)
+def package_locales(
+    root: str,
+    input: str,
+    output: str,
+    groups: set[str] | None = None,
+    workers: int = 1,
+    readonly: bool = True,
+):
+    data = fetch_locales(
+        input, output, log=True, groups=groups, workers=workers, readonly=readonly
+    )
     param = get_bound_param(input, output)
     for group, local_data in data.items():
         output_path = Path(root) / substitute_params(output, {param: group})
         write_json(output_path, local_data)
 
 
+def get_shard_dir(output: str) -> str:
+    """words.json is sharded into words/{id}.json"""
+    return output.removesuffix(".json")
+
+
+def write_shards(directory: Path, data: dict[str, Any]):
+    """
+    Write each top level value of data to its own file, plus a sorted list of ids.
+    Shards of ids no longer in data are removed.
+    """
+    for obj_id, obj_data in data.items():
+        write_json(directory / f"{obj_id}.json", obj_data)
+    write_json(directory / SHARD_INDEX, sorted(data))
+
+    for shard in directory.glob("*.json"):
+        if shard.name != SHARD_INDEX and shard.stem not in data:
+            shard.unlink()
+
+
+def shard_data(
+    root: str, input: str, output: str, workers: int = 1, readonly: bool = True
+):
+    data = fetch_data(input, output, workers=workers, readonly=readonly)
+    write_shards(Path(root) / get_shard_dir(output), data)
+
+
+def shard_locales(
+    root: str,
+    input: str,
+    output: str,
+    groups: set[str] | None = None,
+    workers: int = 1,
+    readonly: bool = True,
+):
+    data = fetch_locales(
+        input, output, groups=groups, workers=workers, readonly=readonly
+    )
+    param = get_bound_param(input, output)
+    for group, local_data in data.items():
+        output_path = substitute_params(output, {param: group})
+        write_shards(Path(root) / get_shard_dir(output_path), local_data)
+
+
 FETCH_MAP = {"data": fetch_data, "locales": fetch_locales}
 PACKAGE_MAP = {"data": package_data, "locales": package_locales}
+SHARD_MAP = {"data": shard_data, "locales": shard_locales}
@@ -0,0 +1,100 @@
+"""
+Validate every packaged json file against its JSON Schema, in one process:
+
+    python .github/workflows/validate_outputs.py --workers 0
+
+"data" outputs are checked against the generated schema of the same name in
+api/generated/v2/, e.g. sandbox/words.json against words.json. No schemas are
+generated for translations yet, so every "locales" output is checked against
+TRANSLATIONS_SCHEMA, which only checks the shape: ids to fields to text.
+
+Each schema is compiled once per worker, and all errors are reported at the end.
+Needs the `jsonschema` package; see schemas.py.
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(SCRIPT_DIR)
+
+import instrument
+from constants import CURRENT_API_VERSION, DATA
+from schemas import TRANSLATIONS, format_errors, get_validator
+from utils import get_worker_count, glob_files
+
+ROOT = f"api/src/raw/{CURRENT_API_VERSION}/"
+
+
+def get_outputs(root: str) -> Iterator[tuple[Path, str]]:
+    """Every packaged file, with the name of the schema it is checked against."""
+    for config in DATA.values():
+        output = config["output"]
+        if config["type"] == "data":
+            yield Path(root) / output, Path(output).name
+            continue
+        for path in glob_files(Path(root, output).as_posix()):
+            yield path, TRANSLATIONS
+
+
+def validate_file(path: Path, schema_name: str) -> list[str]:
+    if not path.exists():
+        return [f"{path}: missing"]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        return [f"{path}: invalid json: {e}"]
+
+    return format_errors(path, get_validator(schema_name), data)
+
+
+def validate_outputs(root: str, workers: int = 1) -> dict[Path, list[str]]:
+    outputs = sorted(get_outputs(root))
+    paths = [path for path, _ in outputs]
+    schema_names = [schema_name for _, schema_name in outputs]
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(validate_file, paths, schema_names, chunksize=8)
+            )
+    else:
+        results = list(map(validate_file, paths, schema_names))
+    return dict(zip(paths, results))
+
+
+def main(workers: int = 1):
+    with instrument.stage("validate_outputs"):
+        results = validate_outputs(ROOT, workers)
+    instrument.count("outputs_validated", len(results))
+
+    failed = {path: errors for path, errors in results.items() if errors}
+    for errors in failed.values():
+        for error in errors:
+            print(error)
+    if failed:
+        total = sum(len(errors) for errors in failed.values())
+        sys.exit(f"{total} error(s) in {len(failed)} of {len(results)} file(s)")
+
+    print(f"Validated {len(results)} file(s)")
+    print("Done!")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--workers",
+        help="Number of processes validating files; 0 for one per cpu",
+        type=int,
+        default=1,
+    )
+    instrument.add_arguments(parser)
+    ARGV = parser.parse_args()
+    instrument.configure(ARGV)
+    main(workers=get_worker_count(ARGV.workers))
@@ -1,4 +1,4 @@
-import json
+import argparse
 import os
 import sys
 from pathlib import Path
@@ -6,13 +6,17 @@ from pathlib import Path
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(SCRIPT_DIR)
 
+import instrument
+import memory
+import parse_cache
 from constants import DATA
+from ref_graph import RefGraph, build_ref_graph
 from utils import (
     cached_toml_read,
-    find_files,
+    find_files_with_values,
     get_bound_param,
-    get_path_values,
     get_unbound_param,
+    get_worker_count,
     load_data,
 )
 
@@ -32,7 +36,75 @@ def report_set_diff(name: str, expected: set, actual: set) -> list[str]:
     return results
 
 
-def main():
+def check_languages(data: dict[str, dict], key: str) -> list[str]:
+    """Confirm all listed langs are in the translation data of one DATA entry."""
+    tr_key = DATA[key]["translations"]
+    return report_set_diff(tr_key, set(data["languages"]), set(data[tr_key]))
+
+
+def check_translation_file(
+    key: str, tr_file: Path, values: dict[str, str]
+) -> list[str]:
+    """Confirm a translation file has a nonempty value for every key in its source."""
+    tr_config = DATA[DATA[key]["translations"]]
+    input = tr_config["input"]
+    output = tr_config["output"]
+
+    filename_param = get_unbound_param(input, output)
+    langcode_param = get_bound_param(input, output)
+    source_file = Path(tr_config["source"].format(**values))
+
+    langcode = values[langcode_param]
+    filename = values[filename_param]
+
+    source = cached_toml_read(source_file, readonly=True)
+    translation = cached_toml_read(tr_file, readonly=True)
+
+    errs = []
+    for object_id in source.keys():
+        if object_id not in translation:
+            errs.append(f"{key} -> {langcode} -> {filename} missing key {object_id}")
+            continue
+        if source.get(object_id) and not translation.get(object_id):
+            errs.append(f"{key} -> {langcode} -> {filename} has empty key {object_id}")
+    return errs
+
+
+def check_ref(graph: RefGraph, key: str, ref: dict, obj_id: str) -> list[str]:
+    """Confirm one ref of one object has valid keys in its target data."""
+    ref_key = ref["key"]
+    # every id that this type can target
+    valid_ids = graph.get_valid_ids(ref["to"])
+
+    refs = graph.get_refs(key, ref_key)
+    if obj_id not in refs:
+        # ill-typed, so left out of the graph for the type check to report
+        return []
+    raw_refs = refs[obj_id]
+    if raw_refs is None:
+        if ref["required"]:
+            return [f"{key} ({obj_id}): missing required key {ref_key}"]
+        return []
+
+    if ref.get("nonempty", False) and not len(raw_refs):
+        return [f"{key} ({obj_id}): empty list {ref_key}"]
+
+    return [
+        f"{key} ({obj_id}): unknown reference in '{ref_key}': '{ref_id}'"
+        for ref_id in raw_refs
+        if ref_id not in valid_ids
+    ]
+
+
+def check_object_refs(graph: RefGraph, key: str, obj_id: str) -> list[str]:
+    """Confirm all refs of one object have valid keys in their target data."""
+    errs = []
+    for ref in DATA[key].get("refs", []):
+        errs.extend(check_ref(graph, key, ref, obj_id))
+    return errs
+
+
+def main(workers: int = 1, typecheck: bool = False):
     """
     - Fetch langs
     - Confirm all langs exist in all types with translations
@@ -40,106 +112,60 @@ def main():
     - Confirm each id of each type exists in all translations
 
     - Check special cases ("see also" in words has existing references in the same data)
+
+    With `typecheck`, also check each data file against its schema from the same parse
     """
-    data = load_data()
-    langs = data["languages"]
-    found_errs = False
+    type_errors = [] if typecheck else None
+    with instrument.stage("load_data"):
+        data = load_data(workers=workers, type_errors=type_errors)
+    with instrument.stage("build_ref_graph"):
+        graph = build_ref_graph(data)
+    errs = list(type_errors or [])
 
     for key, config in DATA.items():
         tr_key = config.get("translations")
         if tr_key:
-            translations = data.get(tr_key)
-            if not translations:
-                print(f"{key} missing translation data")
-                found_errs = True
+            if not data.get(tr_key):
+                errs.append(f"{key} missing translation data")
                 continue
-
-            # confirm all listed langs are in translation data
-            errs = report_set_diff(tr_key, set(langs), set(translations))
-            for err in errs:
-                print(err)
-                found_errs = True
+            errs.extend(check_languages(data, key))
 
             # confirm all data have corresponding keys in translations
-            tr_config = DATA[tr_key]
-            input = tr_config["input"]
-            output = tr_config["output"]
-
-            filename_param = get_unbound_param(input, output)
-            langcode_param = get_bound_param(input, output)
-            for tr_file in find_files(input):
-                values = get_path_values(input, str(tr_file))
-                source_file = Path(tr_config["source"].format(**values))
-
-                langcode = values[langcode_param]
-                filename = values[filename_param]
-
-                source = cached_toml_read(source_file)
-                translation = cached_toml_read(tr_file)
-
-                errs = report_set_diff(
-                    f"{key} -> {langcode} -> {filename}",
-                    set(source),
-                    set(translation),
-                )
-
-                for object_id in source.keys():
-                    if object_id not in translation:
-                        print(
-                            f"{key} -> {langcode} -> {filename} missing key {object_id}",
-                        )
-                        found_errs = True
-                        continue
-                    if source.get(object_id) and not translation.get(object_id):
-                        print(
-                            f"{key} -> {langcode} -> {filename} has empty key {object_id}",
-                        )
-                        found_errs = True
-                        continue
+            tr_input = DATA[tr_key]["input"]
+            for tr_file, values in find_files_with_values(tr_input):
+                errs.extend(check_translation_file(key, tr_file, values))
 
         # confirm all refs have valid keys in target data
-        refs = config.get("refs", [])
-        for ref in refs:
-            ref_key = ref["key"]
-            ref_targets = ref["to"]
-            required = ref["required"]
-            nonempty = ref.get("nonempty", False)
-
-            valid_ids = set()
-            for target in ref_targets:
-                # every id that this type can target
-                valid_ids.update(data.get(target, {}).keys())
-
-            for obj_id, obj_data in data[key].items():
-                raw_refs = obj_data.get(ref_key)
-                if raw_refs is None:
-                    if required:
-                        print(f"{key} ({obj_id}): missing required key {ref_key}")
-                        found_errs = True
-                    continue
-
-                if isinstance(raw_refs, str):
-                    raw_refs = [raw_refs]
-                    # if it isn't a str or list[str],
-                    # that's a toml validation error
-
-                if nonempty and not len(raw_refs):
-                    print(f"{key} ({obj_id}): empty list {ref_key}")
-                    found_errs = True
-                    continue
-
-                for ref_id in raw_refs:
-                    if ref_id not in valid_ids:
-                        print(
-                            f"{key} ({obj_id}): unknown reference in '{ref_key}': '{ref_id}'"
-                        )
-                        found_errs = True
-
-    if found_errs:
+        for ref in config.get("refs", []):
+            for obj_id in graph.get_refs(key, ref["key"]):
+                errs.extend(check_ref(graph, key, ref, obj_id))
+
+    for err in errs:
+        print(err)
+    if errs:
         sys.exit("Error(s) found while checking references in toml data")
 
     print("Done!")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--workers",
+        help="Number of processes parsing TOML files; 0 for one per cpu",
+        type=int,
+        default=1,
+    )
+    _ = parser.add_argument(
+        "--typecheck",
+        help="Also check each data file against its json schema; needs jsonschema",
+        action="store_true",
+    )
+    parse_cache.add_arguments(parser)
+    memory.add_arguments(parser)
+    instrument.add_arguments(parser)
+    ARGV = parser.parse_args()
+    parse_cache.configure(ARGV)
+    memory.configure(ARGV)
+    instrument.configure(ARGV)
+    main(workers=get_worker_count(ARGV.workers), typecheck=ARGV.typecheck)
@@ -0,0 +1,428 @@
+"""
+Keep the parsed corpus in memory, and check and repackage it on every change:
+
+    python .github/workflows/watch.py --typecheck
+
+Changes are picked up with inotify on linux, or by polling (--poll) elsewhere.
+Each change parses only the changed files again. It checks the refs of only
+the objects which are changed or refer to a changed id, and rewrites only the
+json outputs under api/src/raw/v2/ which those files feed. Run
+validate_refs.py once first to see errors which predate the watch.
+"""
+
+import argparse
+import ctypes
+import os
+import select
+import struct
+import sys
+import time
+import tomllib
+from collections import defaultdict
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(SCRIPT_DIR)
+
+from constants import CURRENT_API_VERSION, DATA
+from ref_graph import Node, RefGraph, build_ref_graph
+from utils import (
+    PLAIN_TOML_CACHE,
+    cache_parsed,
+    cached_toml_read,
+    fetch_data,
+    fetch_locales,
+    find_files,
+    find_files_with_values,
+    get_bound_param,
+    get_output_path,
+    get_path_values,
+    get_templates,
+    get_unbound_param,
+    glob_files,
+    glob_to_regex,
+    invalidate_file,
+    load_data,
+    unindex_file,
+    write_json,
+)
+from validate_refs import check_languages, check_object_refs, check_translation_file
+
+ROOT = f"api/src/raw/{CURRENT_API_VERSION}/"
+
+# see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# struct inotify_event, without its variable length name
+EVENT = struct.Struct("iIII")
+# editors often write a file in several steps; wait this long for the rest
+DEBOUNCE_S = 0.05
+
+
+@dataclass
+class Corpus:
+    """The parsed corpus as of the last change, as from load_data()."""
+
+    data: dict[str, dict]
+    graph: RefGraph
+
+
+def is_watched(path: Path) -> bool:
+    posix_path = path.as_posix()
+    return any(
+        glob_to_regex(template).match(posix_path) for template in get_templates()
+    )
+
+
+def get_watch_dirs() -> set[Path]:
+    """Every directory holding files of a template, and the fixed part of each."""
+    dirs = set()
+    for template in get_templates():
+        dirs.add(Path(template.split("{", 1)[0]))
+        dirs.update(file.parent for file in find_files(template))
+    return {directory for directory in dirs if directory.is_dir()}
+
+
+def get_inotify() -> ctypes.CDLL | None:
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def parse_events(raw: bytes) -> Iterator[tuple[int, int, str]]:
+    offset = 0
+    while offset < len(raw):
+        wd, mask, _, length = EVENT.unpack_from(raw, offset)
+        offset += EVENT.size
+        name = raw[offset : offset + length].rstrip(b"\0")
+        offset += length
+        yield wd, mask, os.fsdecode(name)
+
+
+def watch_inotify(libc: ctypes.CDLL) -> Iterator[set[Path]]:
+    """Yield each batch of changed paths, as reported by inotify."""
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    watches: dict[int, Path] = {}
+
+    def add_watch(directory: Path):
+        wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+        if wd >= 0:
+            watches[wd] = directory
+
+    for directory in get_watch_dirs():
+        add_watch(directory)
+    try:
+        while True:
+            changed = set()
+            timeout = None
+            while select.select([fd], [], [], timeout)[0]:
+                for wd, mask, name in parse_events(os.read(fd, 64 * 1024)):
+                    if wd not in watches or not name:
+                        continue
+                    path = watches[wd] / name
+                    if not mask & IN_ISDIR:
+                        changed.add(path)
+                    elif mask & (IN_CREATE | IN_MOVED_TO):
+                        # e.g. a new language; its files may already be there
+                        add_watch(path)
+                        changed.update(file for file in path.rglob("*.toml"))
+                timeout = DEBOUNCE_S
+            yield changed
+    finally:
+        os.close(fd)
+
+
+def snapshot() -> dict[Path, int]:
+    files = {}
+    for template in get_templates():
+        for file in glob_files(template):
+            try:
+                files[file] = file.stat().st_mtime_ns
+            except FileNotFoundError:
+                pass
+    return files
+
+
+def watch_polling(interval: float) -> Iterator[set[Path]]:
+    """Yield each batch of changed paths, found by comparing mtimes."""
+    previous = snapshot()
+    while True:
+        time.sleep(interval)
+        current = snapshot()
+        changed = {
+            file
+            for file in previous.keys() | current.keys()
+            if previous.get(file) != current.get(file)
+        }
+        previous = current
+        if changed:
+            yield changed
+
+
+def get_changes(paths: set[Path], template_key: str) -> dict[str, set[str]]:
+    """Map each DATA key to its changed files which match its input or source."""
+    changes = defaultdict(set)
+    for key, config in DATA.items():
+        template = config.get(template_key)
+        if not template:
+            continue
+        pattern = glob_to_regex(template)
+        for path in paths:
+            if pattern.match(path.as_posix()):
+                changes[key].add(path.as_posix())
+    return dict(changes)
+
+
+def describe_parse_error(e: Exception, default: str) -> str:
+    """The file parse_toml_file noted on a syntax error, else `default`."""
+    return " ".join(getattr(e, "__notes__", [])) or default
+
+
+def reparse(paths: set[Path]) -> list[str]:
+    """
+    Parse each changed file again. A file with a syntax error keeps its last good
+    parse, or is left out of the corpus if it has none, until it is fixed.
+    """
+    errs = []
+    for path in sorted(paths):
+        previous = PLAIN_TOML_CACHE.get(path)
+        invalidate_file(path)
+        try:
+            cached_toml_read(path, readonly=True)
+        except tomllib.TOMLDecodeError as e:
+            errs.append(f"{path}: {e}")
+            if previous is not None:
+                cache_parsed(path, previous, readonly=True)
+            else:
+                unindex_file(path)
+    return errs
+
+
+def refresh_data(corpus: Corpus, changes: dict[str, set[str]]) -> list[str]:
+    """
+    Fetch each changed entry again; unchanged files come from the cache. An entry
+    which still fails to parse keeps its previous data.
+    """
+    errs = []
+    for key, files in changes.items():
+        try:
+            refresh_entry(corpus, key, files)
+        except tomllib.TOMLDecodeError as e:
+            errs.append(f"{describe_parse_error(e, key)}: {e}")
+    return errs
+
+
+def refresh_entry(corpus: Corpus, key: str, files: set[str]):
+    config = DATA[key]
+    input = config["input"]
+    output = config["output"]
+    if config["type"] == "data":
+        corpus.data[key] = fetch_data(input, output)
+        return
+    param = get_bound_param(input, output)
+    groups = {get_path_values(input, file)[param] for file in files}
+    fetched = fetch_locales(input, output, groups=groups)
+    objects = corpus.data.setdefault(key, {})
+    for group in groups:
+        if group in fetched:
+            objects[group] = fetched[group]
+        else:
+            objects.pop(group, None)
+
+
+def write_outputs(corpus: Corpus, changes: dict[str, set[str]]) -> list[str]:
+    """
+    Write each output fed by a changed file, as package_data.py would.
+    Returns those whose content changed.
+    """
+    written = []
+    for key, files in changes.items():
+        # unavailable until all of its files parse; see get_unavailable
+        if key not in corpus.data:
+            continue
+        config = DATA[key]
+        input = config["input"]
+        output = config["output"]
+        outputs = {get_output_path(input, output, file) for file in files}
+        for output_path in sorted(outputs):
+            if config["type"] == "data":
+                objects = corpus.data[key]
+            else:
+                param = get_bound_param(input, output)
+                group = get_path_values(output, output_path)[param]
+                if group not in corpus.data[key]:
+                    continue
+                objects = corpus.data[key][group]
+            if write_json(Path(ROOT) / output_path, objects):
+                written.append(output_path)
+    return written
+
+
+def get_unavailable(corpus: Corpus) -> list[str]:
+    """Entries left out of the corpus, since one of their files never parsed."""
+    return [
+        f"{key} is unavailable until its files parse; not written or checked"
+        for key in DATA
+        if key not in corpus.data
+    ]
+
+
+def get_affected(
+    changes: dict[str, set[str]], old: RefGraph, new: RefGraph
+) -> set[Node]:
+    """Changed objects, and every object referring to one of their ids."""
+    affected = set()
+    for key, files in changes.items():
+        config = DATA[key]
+        if config["type"] != "data":
+            continue
+        key_param = get_unbound_param(config["input"], config["output"])
+        for file in files:
+            obj_id = get_path_values(config["input"], file)[key_param]
+            affected.add((key, obj_id))
+            affected.update(old.get_referrers(key, obj_id))
+            affected.update(new.get_referrers(key, obj_id))
+    return affected
+
+
+def check_changes(
+    corpus: Corpus,
+    changes: dict[str, set[str]],
+    source_changes: dict[str, set[str]],
+    old_graph: RefGraph,
+    typecheck: bool,
+) -> list[str]:
+    errs = []
+    for key, obj_id in sorted(get_affected(changes, old_graph, corpus.graph)):
+        if obj_id in corpus.data.get(key, {}):
+            errs.extend(check_object_refs(corpus.graph, key, obj_id))
+
+    for key, config in DATA.items():
+        tr_key = config.get("translations")
+        if not tr_key:
+            continue
+        if "languages" not in corpus.data:
+            continue
+        if not corpus.data.get(tr_key):
+            errs.append(f"{key} missing translation data")
+            continue
+        errs.extend(check_languages(corpus.data, key))
+
+        # translation files which changed, or whose source did
+        tr_config = DATA[tr_key]
+        filename_param = get_unbound_param(tr_config["input"], tr_config["output"])
+        changed_ids = {
+            get_path_values(tr_config["source"], file)[filename_param]
+            for file in source_changes.get(tr_key, ())
+        }
+        for tr_file, values in find_files_with_values(tr_config["input"]):
+            if (
+                tr_file.as_posix() in changes.get(tr_key, ())
+                or values[filename_param] in changed_ids
+            ):
+                errs.extend(check_translation_file(key, tr_file, values))
+
+    if typecheck:
+        import schemas
+
+        for key, files in changes.items():
+            config = DATA[key]
+            data = corpus.data.get(key)
+            if "schema" not in config or data is None:
+                continue
+            key_param = get_unbound_param(config["input"], config["output"])
+            obj_ids = {
+                get_path_values(config["input"], file)[key_param] for file in files
+            }
+            objects = {obj_id: data[obj_id] for obj_id in obj_ids if obj_id in data}
+            errs.extend(schemas.check_objects(config, objects))
+    return errs
+
+
+def update(corpus: Corpus, paths: set[Path], typecheck: bool = False) -> bool:
+    """Apply one batch of changed paths. Returns whether any of them mattered."""
+    paths = {path for path in paths if is_watched(path)}
+    if not paths:
+        return False
+    errs = reparse(paths)
+
+    changes = get_changes(paths, "input")
+    source_changes = get_changes(paths, "source")
+    errs.extend(refresh_data(corpus, changes))
+    errs.extend(get_unavailable(corpus))
+    for output_path in write_outputs(corpus, changes):
+        print(f"Wrote {output_path}")
+
+    old_graph = corpus.graph
+    corpus.graph = build_ref_graph(corpus.data)
+    try:
+        errs.extend(
+            check_changes(corpus, changes, source_changes, old_graph, typecheck)
+        )
+    except tomllib.TOMLDecodeError as e:
+        # e.g. the new, unparsable, source of existing translations
+        errs.append(f"{describe_parse_error(e, 'checking changes')}: {e}")
+    for err in errs:
+        print(err)
+    if not errs:
+        print("No errors")
+    return True
+
+
+def main(poll: bool = False, interval: float = 0.5, typecheck: bool = False):
+    start = time.perf_counter()
+    data = load_data()
+    corpus = Corpus(data=data, graph=build_ref_graph(data))
+    print(f"Loaded the corpus in {time.perf_counter() - start:.2f}s")
+
+    libc = None if poll else get_inotify()
+    if libc is None:
+        print(f"Watching for changes every {interval}s")
+        changes = watch_polling(interval)
+    else:
+        print("Watching for changes")
+        changes = watch_inotify(libc)
+
+    try:
+        for paths in changes:
+            start = time.perf_counter()
+            if update(corpus, paths, typecheck):
+                print(f"Updated in {(time.perf_counter() - start) * 1000:.0f}ms")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument(
+        "--poll",
+        help="Poll for changes instead of using inotify",
+        action="store_true",
+    )
+    _ = parser.add_argument(
+        "--interval",
+        help="Seconds between polls",
+        type=float,
+        default=0.5,
+    )
+    _ = parser.add_argument(
+        "--typecheck",
+        help="Also check changed data files against their json schemas",
+        action="store_true",
+    )
+    ARGV = parser.parse_args()
+    main(poll=ARGV.poll, interval=ARGV.interval, typecheck=ARGV.typecheck)